@@ -7,31 +7,65 @@
 #
 
 import sys, argparse, datetime, time, threading, signal, functools, os
-import configparser, pprint
-from math import floor
-from re import match as re_match
+import configparser, pprint, operator, struct, socket, collections
+from math import floor, ceil, log, exp, lgamma
+from re import match as re_match, compile as re_compile, error as re_error, search as re_search, fullmatch as re_fullmatch
 
 import asyncio
 
 ## env variable to enable asyncio debug output
 # PYTHONASYNCIODEBUG=1
 
-global_ts_start = datetime.datetime.now().timestamp()
+# All measurement timestamps are integer nanoseconds of a monotonic clock, so
+# NTP or other changes of the wall clock do not influence the results. The wall
+# clock is only used to show the time of day in bsprint().
+NS_PER_SEC = 1000000000
+
+clock_ns = time.monotonic_ns
+
+def set_clock(clock):
+	global clock_ns, clock_offset_ns
+	
+	if clock == "monotonic-raw":
+		clock_ns = functools.partial(time.clock_gettime_ns, time.CLOCK_MONOTONIC_RAW)
+	else:
+		clock_ns = time.monotonic_ns
+	
+	clock_offset_ns = time.time_ns() - clock_ns()
+
+set_clock("monotonic")
+
+# convert a measurement timestamp into seconds since the epoch
+def wall_time(ts):
+	return (ts + clock_offset_ns) / NS_PER_SEC
+
+global_ts_start = clock_ns()
 global_stop = False
 
+# minimal time between two blocks of serial data
+delta_min = None
+
+# statistics of the correction applied by --estimate-line-ts
+ts_correction_max = None
+ts_correction_sum = 0
+ts_correction_lines = 0
+
 adaptive_diff_output = 1
 
+# prepended to every line that is shown by a worker of a board pool
+output_prefix = ""
+
 def bsprint(*args, **kwargs):
 	if "file" in kwargs:
 		f = kwargs["file"]
 	else:
 		f = sys.stdout
 	if "ts" in kwargs:
-		dt = datetime.datetime.fromtimestamp(kwargs["ts"])
+		dt = datetime.datetime.fromtimestamp((kwargs["ts"] + clock_offset_ns) / NS_PER_SEC)
 		del kwargs["ts"]
 	else:
 		dt = datetime.datetime.now()
-	print(dt.strftime("%H:%M:%S.%f "), end="", file=f)
+	print(output_prefix + dt.strftime("%H:%M:%S.%f "), end="", file=f)
 	if "diff" in kwargs:
 		diff = kwargs["diff"]
 		del kwargs["diff"]
@@ -61,6 +95,1773 @@ def bsprint(*args, **kwargs):
 	print("| ", end="", file=f)
 	print(*args, **kwargs)
 
+# Aho-Corasick automaton that finds all occurrences of a set of byte strings
+# with a single pass over a line. Every state is stored as a list with 257
+# entries: the first 256 entries point directly to the next state for each
+# possible input byte and the last entry contains the values of all patterns
+# that end in this state (or None).
+class TriggerMatcher():
+	def __init__(self):
+		self.patterns = {}
+		self.root = None
+	
+	def add(self, pattern, value):
+		if pattern not in self.patterns:
+			self.patterns[pattern] = []
+		self.patterns[pattern].append(value)
+	
+	def compile(self):
+		from collections import deque
+		
+		# build the trie
+		goto = [{}]
+		out = [set()]
+		for pattern, values in self.patterns.items():
+			state = 0
+			for b in pattern:
+				if b not in goto[state]:
+					goto.append({})
+					out.append(set())
+					goto[state][b] = len(goto) - 1
+				state = goto[state][b]
+			out[state].update(values)
+		
+		# calculate the failure links in breadth-first order and resolve them
+		# into a complete transition table
+		fail = [0] * len(goto)
+		delta = [None] * len(goto)
+		delta[0] = [goto[0].get(b, 0) for b in range(256)]
+		queue = deque(goto[0].values())
+		while queue:
+			state = queue.popleft()
+			out[state] |= out[fail[state]]
+			
+			row = list(delta[fail[state]])
+			for b, next_state in goto[state].items():
+				fail[next_state] = delta[fail[state]][b]
+				row[b] = next_state
+				queue.append(next_state)
+			delta[state] = row
+		
+		nodes = [[None] * 257 for _ in goto]
+		for state, node in enumerate(nodes):
+			for b in range(256):
+				node[b] = nodes[delta[state][b]]
+			node[256] = frozenset(out[state]) if out[state] else None
+		
+		self.root = nodes[0]
+	
+	# returns the set of values of all patterns that occur in line
+	def search(self, line):
+		node = self.root
+		if node is None:
+			return set()
+		
+		found = set(node[256]) if node[256] else set()
+		for b in line:
+			node = node[b]
+			if node[256]:
+				found.update(node[256])
+		
+		return found
+
+# compiled representation of a [trigger_*] section that avoids configparser
+# lookups while processing lines
+class Trigger():
+	__slots__ = (
+		"name", "pretty_name", "index", "pattern", "regexp", "source",
+		"before", "after", "multi_trigger", "ignore_multiple_trigger",
+		"power_cycle", "power_cycle_after", "start_task", "stop_task",
+		"intervals",
+		)
+	
+	def __init__(self, name, mdict, index, default_source):
+		config = mdict["config"]
+		
+		self.name = name
+		self.pretty_name = mdict["name"]
+		self.index = index
+		self.pattern = mdict.get("trigger", None)
+		self.regexp = mdict.get("regexp", None)
+		self.source = config.get("source", None) or default_source
+		self.before = config.get("before", None) or None
+		self.after = config.get("after", None) or None
+		self.multi_trigger = int(config.get("multi_trigger", "0"))
+		self.ignore_multiple_trigger = int(config.get("ignore_multiple_trigger", "0"))
+		self.power_cycle = config.get("powerCycle", "0") == "1"
+		self.power_cycle_after = int(config.get("powerCycleAfter", "0"))
+		self.start_task = config.get("start_task", None)
+		self.stop_task = config.get("stop_task", None)
+		self.intervals = tuple(mdict.get("intervals", ()))
+	
+	# used for additional values of multi_trigger triggers
+	def copy(self, name, pretty_name):
+		trig = Trigger.__new__(Trigger)
+		for attr in Trigger.__slots__:
+			setattr(trig, attr, getattr(self, attr))
+		trig.name = name
+		trig.pretty_name = pretty_name
+		
+		return trig
+
+# all triggers that are interested in lines from a certain source
+class TriggerIndex():
+	def __init__(self, triggers):
+		self.triggers = triggers
+		
+		# compile all literal triggers into a single automaton that returns the
+		# candidate triggers for a line in one pass
+		self.matcher = TriggerMatcher()
+		for trig in triggers:
+			if trig.pattern is not None:
+				self.matcher.add(trig.pattern, trig)
+		self.matcher.compile()
+		
+		self.compile_regexps([trig for trig in triggers if trig.regexp is not None])
+	
+	# Merge all regexp triggers into one alternation with a named group per
+	# trigger. A single match() call then returns the first regexp trigger
+	# that matches a line. Patterns with backreferences, named groups or
+	# global flags cannot be merged safely and are matched separately.
+	def compile_regexps(self, regexp_triggers):
+		default_flags = re_compile(b"").flags
+		
+		merged = []
+		self.regexp_separate = set()
+		self.regexp_groups = {}
+		for trig in regexp_triggers:
+			if (
+				trig.regexp.groupindex
+				or trig.regexp.flags != default_flags
+				or re_search(rb"\\[0-9]", trig.regexp.pattern)
+				):
+				self.regexp_separate.add(trig)
+				continue
+			
+			group = "bs%d" % len(merged)
+			self.regexp_groups[group] = trig
+			merged.append(trig)
+		
+		# if a merged trigger is rejected later (e.g., due to before/after), all
+		# following merged triggers have to be checked separately
+		self.regexp_following = {}
+		for i, trig in enumerate(merged):
+			self.regexp_following[trig] = merged[i:]
+		
+		self.regexp_combined = None
+		if merged:
+			try:
+				self.regexp_combined = re_compile(b"|".join(
+					b"(?P<%s>%s)" % (group.encode(), trig.regexp.pattern)
+					for group, trig in self.regexp_groups.items()
+					))
+			except re_error as exc:
+				if args.verbose:
+					bsprint("cannot merge regexp triggers, will match them separately:", exc)
+				self.regexp_separate.update(merged)
+				self.regexp_following = {}
+	
+	# yields all triggers that match line in the order of the configuration.
+	# Blocked triggers are skipped before their regexp is evaluated.
+	def search(self, line, blocked=()):
+		# literal triggers were already matched by the automaton, we only have
+		# to check the regexp triggers
+		candidates = self.matcher.search(line)
+		candidates.update(self.regexp_separate)
+		candidates.difference_update(blocked)
+		
+		regexp_hit = None
+		if self.regexp_combined:
+			m = self.regexp_combined.match(line)
+			if m:
+				regexp_hit = self.regexp_groups[m.lastgroup]
+				candidates.update(self.regexp_following[regexp_hit])
+		
+		for trig in sorted(candidates, key=trigger_index_key):
+			if trig in blocked:
+				continue
+			if trig.regexp is None or trig is regexp_hit or trig.regexp.match(line):
+				yield trig
+
+trigger_index_key = operator.attrgetter("index")
+
+# State of the current iteration that is updated incrementally with every
+# recorded value. Instead of scanning all triggers after every match, we count
+# the outstanding triggers and keep the set of triggers that cannot fire in the
+# current boot stage due to their before/after settings.
+class IterationState():
+	__slots__ = ("values", "matched", "outstanding", "blocked", "power_cycle", "deps", "energy", "energy_marks", "energy_done")
+	
+	def __init__(self, triggers, deps):
+		# "power_on" is recorded when the device is actually powered on
+		self.values = {}
+		self.matched = set()
+		
+		# consumed energy up to power_on and every mpoint
+		self.energy = {}
+		self.energy_marks = []
+		self.energy_done = set()
+		self.outstanding = len(triggers)
+		self.power_cycle = None
+		self.deps = deps
+		
+		self.blocked = set()
+		for trig in triggers.values():
+			if self.is_blocked(trig):
+				self.blocked.add(trig)
+	
+	def is_blocked(self, trig):
+		return (
+			trig.after and trig.after not in self.values
+			or trig.before and trig.before in self.values
+			)
+	
+	# store the value of a mpoint or interval and update all triggers that
+	# depend on it
+	def record(self, name, value):
+		self.values[name] = value
+		
+		for trig in self.deps.get(name, ()):
+			if self.is_blocked(trig):
+				self.blocked.add(trig)
+			else:
+				self.blocked.discard(trig)
+	
+	def match(self, trig):
+		if trig not in self.matched:
+			self.matched.add(trig)
+			self.outstanding -= 1
+		
+		# like before, the first powerCycle trigger in the configuration wins
+		if trig.power_cycle and (self.power_cycle is None or trig.index < self.power_cycle.index):
+			self.power_cycle = trig
+	
+	# all triggers matched or a powerCycle trigger matched
+	def done(self):
+		return self.power_cycle is not None or self.outstanding == 0
+
+# Welford's online algorithm for the mean and variance of a stream of values
+# with constant memory. Two instances can be merged, e.g., to combine the
+# values of several boards.
+class RunningStats():
+	__slots__ = ("n", "mean", "m2", "min", "max")
+	
+	def __init__(self, n=0, mean=0.0, m2=0.0, min=None, max=None):
+		self.n = n
+		self.mean = mean
+		self.m2 = m2
+		self.min = min
+		self.max = max
+	
+	def add(self, value):
+		self.n += 1
+		delta = value - self.mean
+		self.mean += delta / self.n
+		self.m2 += delta * (value - self.mean)
+		
+		if self.min is None or value < self.min:
+			self.min = value
+		if self.max is None or value > self.max:
+			self.max = value
+	
+	def merge(self, other):
+		if other.n == 0:
+			return
+		if self.n == 0:
+			self.n, self.mean, self.m2, self.min, self.max = other.state()
+			return
+		
+		n = self.n + other.n
+		delta = other.mean - self.mean
+		self.mean += delta * other.n / n
+		self.m2 += other.m2 + delta * delta * self.n * other.n / n
+		self.n = n
+		
+		self.min = min(self.min, other.min)
+		self.max = max(self.max, other.max)
+	
+	# sample standard deviation
+	def dev(self):
+		if self.n < 2:
+			return 0
+		return (self.m2 / (self.n - 1)) ** 0.5
+	
+	# plain values to pass the statistics to another process
+	def state(self):
+		return [self.n, self.mean, self.m2, self.min, self.max]
+
+# relative accuracy of the quantiles of a QuantileSketch
+SKETCH_ACCURACY = 0.01
+# maximum number of buckets of a QuantileSketch
+SKETCH_MAX_BUCKETS = 2048
+# values closer to zero are counted as zero (1 ns)
+SKETCH_MIN_VALUE = 1e-9
+
+# Histogram with logarithmically sized buckets to estimate quantiles of a
+# stream of values. The quantiles have a relative error of at most
+# SKETCH_ACCURACY and the memory is limited by SKETCH_MAX_BUCKETS. Two sketches
+# are merged by adding the counts of their buckets.
+class QuantileSketch():
+	gamma = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+	log_gamma = log(gamma)
+	
+	def __init__(self, state=None):
+		self.n = 0
+		self.zero = 0
+		self.positive = {}
+		self.negative = {}
+		self.min = None
+		self.max = None
+		
+		if state:
+			zero, positive, negative, self.min, self.max = state
+			self.zero = zero
+			self.n = zero
+			for key, count in positive:
+				self.positive[key] = count
+				self.n += count
+			for key, count in negative:
+				self.negative[key] = count
+				self.n += count
+	
+	def key(self, value):
+		return ceil(log(value) / self.log_gamma)
+	
+	# representative value of a bucket
+	def value(self, key):
+		return 2 * self.gamma ** key / (self.gamma + 1)
+	
+	# lower and upper limit of a bucket
+	def limits(self, key):
+		return (self.gamma ** (key - 1), self.gamma ** key)
+	
+	def add(self, value, count=1):
+		self.n += count
+		if self.min is None or value < self.min:
+			self.min = value
+		if self.max is None or value > self.max:
+			self.max = value
+		if value > SKETCH_MIN_VALUE:
+			key = self.key(value)
+			self.positive[key] = self.positive.get(key, 0) + count
+		elif value < -SKETCH_MIN_VALUE:
+			key = self.key(-value)
+			self.negative[key] = self.negative.get(key, 0) + count
+		else:
+			self.zero += count
+		
+		if len(self.positive) + len(self.negative) > SKETCH_MAX_BUCKETS:
+			self.collapse()
+	
+	# join the buckets of the values closest to zero until the sketch has
+	# SKETCH_MAX_BUCKETS buckets again. Only the accuracy of these values
+	# suffers.
+	def collapse(self):
+		for buckets in (self.negative, self.positive):
+			keys = sorted(buckets)
+			while len(keys) > 1 and len(self.positive) + len(self.negative) > SKETCH_MAX_BUCKETS:
+				buckets[keys[1]] += buckets.pop(keys[0])
+				keys.pop(0)
+	
+	def merge(self, other):
+		if other.n == 0:
+			return
+		
+		self.n += other.n
+		if self.min is None or other.min < self.min:
+			self.min = other.min
+		if self.max is None or other.max > self.max:
+			self.max = other.max
+		self.zero += other.zero
+		for key, count in other.positive.items():
+			self.positive[key] = self.positive.get(key, 0) + count
+		for key, count in other.negative.items():
+			self.negative[key] = self.negative.get(key, 0) + count
+		
+		if len(self.positive) + len(self.negative) > SKETCH_MAX_BUCKETS:
+			self.collapse()
+	
+	# all buckets as (value, lower limit, upper limit, count) in ascending
+	# order. The values are limited to the smallest and largest value seen.
+	def buckets(self):
+		clamp = lambda value: min(max(value, self.min), self.max)
+		
+		for key in sorted(self.negative, reverse=True):
+			low, high = self.limits(key)
+			yield (clamp(-self.value(key)), clamp(-high), clamp(-low), self.negative[key])
+		if self.zero:
+			yield (clamp(0.0), clamp(0.0), clamp(0.0), self.zero)
+		for key in sorted(self.positive):
+			low, high = self.limits(key)
+			yield (clamp(self.value(key)), clamp(low), clamp(high), self.positive[key])
+	
+	def quantile(self, q):
+		if self.n == 0:
+			return None
+		
+		rank = q * (self.n - 1)
+		seen = 0
+		for value, low, high, count in self.buckets():
+			seen += count
+			if seen > rank:
+				return value
+		return value
+	
+	# plain values to pass the sketch to another process
+	def state(self):
+		return [self.zero, list(self.positive.items()), list(self.negative.items()), self.min, self.max]
+	
+	# returns the lines of an ASCII histogram with the given number of rows
+	def histogram(self, rows=10, width=50):
+		if self.n == 0:
+			return []
+		
+		step = (self.max - self.min) / rows
+		if step == 0:
+			return ["%10.6f - %10.6f | %-*s %d" % (self.min, self.max, width, "#" * width, self.n)]
+		
+		# spread the count of every bucket over the rows it overlaps
+		counts = [0] * rows
+		for value, low, high, count in self.buckets():
+			first = min(rows - 1, int((low - self.min) / step))
+			last = min(rows - 1, int((high - self.min) / step))
+			if first == last:
+				counts[first] += count
+				continue
+			
+			for row in range(first, last + 1):
+				overlap = min(high, self.min + (row + 1) * step) - max(low, self.min + row * step)
+				counts[row] += count * overlap / (high - low)
+		
+		lines = []
+		for row in range(rows):
+			bar = "#" * round(counts[row] / max(counts) * width)
+			lines.append("%10.6f - %10.6f | %-*s %d" % (self.min + row * step, self.min + (row + 1) * step, width, bar, round(counts[row])))
+		return lines
+
+# event types that are passed through the EventBus
+EVENT_LINE, EVENT_POWER, EVENT_TASK, EVENT_BLOCK = range(4)
+
+# Bounded queue that receives the events of all measurement sources, e.g., the
+# UART and sigrok threads, the journal and the tasks. A single consumer on the
+# event loop drains the queue in batches and only the first event of a batch
+# schedules a wakeup of the event loop.
+class EventBus():
+	def __init__(self, loop, handler, maxsize):
+		from collections import deque
+		
+		self.loop = loop
+		self.handler = handler
+		self.maxsize = maxsize
+		self.queue = deque()
+		self.lock = threading.Lock()
+		self.wakeup_pending = False
+		
+		self.pushed = 0
+		self.dropped = 0
+		self.reported_drops = 0
+		self.max_depth = 0
+		self.batches = 0
+	
+	def push_many(self, events):
+		with self.lock:
+			free = self.maxsize - len(self.queue)
+			if len(events) > free:
+				# Only text lines are dropped if the queue is full. A lost power
+				# event or edge of a logic analyzer channel would break the
+				# state of the iteration, hence the queue grows for them.
+				kept = []
+				for event in events:
+					if len(kept) < free or event[0] != EVENT_LINE or event[3] == "sigrok":
+						kept.append(event)
+					else:
+						self.dropped += 1
+				events = kept
+			
+			self.queue.extend(events)
+			self.pushed += len(events)
+			if len(self.queue) > self.max_depth:
+				self.max_depth = len(self.queue)
+			
+			if self.wakeup_pending or not self.queue:
+				return
+			self.wakeup_pending = True
+		
+		# call_soon() is not thread-safe and call_soon_threadsafe() additionally
+		# writes to the self-pipe of the loop, hence we check the current thread
+		try:
+			running_loop = asyncio.get_running_loop()
+		except RuntimeError:
+			running_loop = None
+		
+		if running_loop is self.loop:
+			self.loop.call_soon(self.drain)
+		else:
+			self.loop.call_soon_threadsafe(self.drain)
+	
+	def push_line(self, ts, line, source):
+		self.push_many(((EVENT_LINE, ts, line, source), ))
+	
+	# the lines of one read block are enclosed by EVENT_BLOCK events
+	def push_lines(self, lines, source):
+		events = [(EVENT_BLOCK, True)]
+		events.extend((EVENT_LINE, ts, line, source) for ts, line in lines)
+		events.append((EVENT_BLOCK, False))
+		self.push_many(events)
+	
+	def push_power(self, ts, state):
+		self.push_many(((EVENT_POWER, ts, state), ))
+	
+	def push_task(self, ts, data, source):
+		self.push_many(((EVENT_TASK, ts, data, source), ))
+	
+	def depth(self):
+		return len(self.queue)
+	
+	def drain(self):
+		with self.lock:
+			events = self.queue
+			self.queue = type(events)()
+			self.wakeup_pending = False
+			self.batches += 1
+			dropped = self.dropped
+		
+		if dropped > self.reported_drops:
+			bsprint("event queue full, dropped %d lines (%d in total)" % (dropped - self.reported_drops, dropped), file=sys.stderr)
+			self.reported_drops = dropped
+		
+		self.handler(events)
+
+# A capture file consists of a header, blocks of records and a trailing index.
+#
+# header: magic, version, compression and the offset between the monotonic and
+#         the wall clock of the recording host
+# block:  compression, compressed and uncompressed length, records
+# record: monotonic timestamp in ns, kind, source id, payload length, payload
+# index:  iteration number and file offset of the block that starts with the
+#         iteration, followed by the offset of the index, the number of
+#         entries and a magic
+#
+# Every iteration starts a new block that begins with the definitions of all
+# known sources, hence a reader can start decoding at any iteration.
+CAPTURE_MAGIC = b"BSCAP\x00"
+CAPTURE_INDEX_MAGIC = b"BSIDX\x00\x00\x00"
+CAPTURE_VERSION = 2
+CAPTURE_BLOCK_SIZE = 64 * 1024
+
+CAPTURE_SOURCE, CAPTURE_ITERATION, CAPTURE_POWER, CAPTURE_LINE = range(4)
+capture_kinds = { "iteration": CAPTURE_ITERATION, "power": CAPTURE_POWER, "line": CAPTURE_LINE }
+capture_kind_names = { v: k for k, v in capture_kinds.items() }
+
+capture_compressions = { "none": 0, "gzip": 1, "zstd": 2 }
+
+capture_header = struct.Struct("<6sBBq")
+capture_block_header = struct.Struct("<BII")
+capture_record_header = struct.Struct("<qBBI")
+capture_index_entry = struct.Struct("<IQ")
+capture_footer = struct.Struct("<QI8s")
+
+def capture_codec(compression):
+	if compression == capture_compressions["gzip"]:
+		import zlib
+		
+		return zlib.compress, zlib.decompress
+	elif compression == capture_compressions["zstd"]:
+		try:
+			import zstandard
+		except ImportError:
+			bsprint("error, zstd compression requires the zstandard module", file=sys.stderr)
+			sys.exit(1)
+		
+		return zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+	
+	return None, None
+
+class CaptureWriter():
+	def __init__(self, path, compression="none"):
+		self.f = open(path, "wb", buffering=1024 * 1024)
+		self.compression = capture_compressions[compression]
+		self.compress, _ = capture_codec(self.compression)
+		self.sources = {}
+		self.index = []
+		self.block = bytearray()
+		
+		self.f.write(capture_header.pack(CAPTURE_MAGIC, CAPTURE_VERSION, self.compression, clock_offset_ns))
+	
+	def flush_block(self):
+		if not self.block:
+			return
+		
+		data = bytes(self.block)
+		if self.compress:
+			data = self.compress(data)
+		self.f.write(capture_block_header.pack(self.compression, len(data), len(self.block)))
+		self.f.write(data)
+		self.block = bytearray()
+	
+	def append(self, ts, kind, source_id, payload):
+		self.block += capture_record_header.pack(ts, kind, source_id, len(payload))
+		self.block += payload
+	
+	def source_id(self, source):
+		if source not in self.sources:
+			self.sources[source] = len(self.sources)
+			self.append(0, CAPTURE_SOURCE, self.sources[source], source.encode())
+		
+		return self.sources[source]
+	
+	def write(self, ts, kind, source, payload):
+		if kind == "iteration":
+			self.flush_block()
+			self.index.append((int(payload), self.f.tell()))
+			for name, sid in self.sources.items():
+				self.append(0, CAPTURE_SOURCE, sid, name.encode())
+		
+		self.append(ts, capture_kinds[kind], self.source_id(source), payload)
+		
+		if len(self.block) >= CAPTURE_BLOCK_SIZE:
+			self.flush_block()
+	
+	def close(self):
+		self.flush_block()
+		
+		index_offset = self.f.tell()
+		for entry in self.index:
+			self.f.write(capture_index_entry.pack(*entry))
+		self.f.write(capture_footer.pack(index_offset, len(self.index), CAPTURE_INDEX_MAGIC))
+		self.f.close()
+
+def capture_write(ts, kind, source, payload):
+	global capture_writer
+	
+	if not capture_writer:
+		if args.verbose:
+			bsprint("opening", args.capture_file)
+		capture_writer = CaptureWriter(args.capture_file, args.capture_compression)
+	
+	capture_writer.write(ts, kind, source, payload)
+
+# Memory-maps a capture file. If the capture was not closed properly and the
+# index is missing, the index is rebuilt by scanning the blocks.
+class CaptureReader():
+	def __init__(self, path):
+		import mmap
+		
+		with open(path, "rb") as f:
+			# mmap() cannot map an empty file
+			if os.fstat(f.fileno()).st_size == 0:
+				bsprint("error, capture %s is empty" % path, file=sys.stderr)
+				sys.exit(1)
+			self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		self.view = memoryview(self.mm)
+		
+		if len(self.mm) < capture_header.size:
+			magic = None
+		else:
+			magic, version, self.compression, self.clock_offset_ns = capture_header.unpack_from(self.mm, 0)
+		if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+			bsprint("error, %s is not a bootstats capture" % path, file=sys.stderr)
+			sys.exit(1)
+		
+		self.index = None
+		self.data_end = len(self.mm)
+		if len(self.mm) >= capture_header.size + capture_footer.size:
+			index_offset, count, magic = capture_footer.unpack_from(self.mm, len(self.mm) - capture_footer.size)
+			if magic == CAPTURE_INDEX_MAGIC:
+				self.index = [
+					capture_index_entry.unpack_from(self.mm, index_offset + i * capture_index_entry.size)
+					for i in range(count)
+					]
+				self.data_end = index_offset
+		
+		if self.index is None:
+			if args.verbose:
+				bsprint("no index found in %s, scanning blocks" % path)
+			self.rebuild_index()
+	
+	def blocks(self, offset):
+		decompressors = {}
+		while offset + capture_block_header.size <= self.data_end:
+			compression, length, raw_length = capture_block_header.unpack_from(self.mm, offset)
+			start = offset + capture_block_header.size
+			if start + length > self.data_end:
+				# incomplete block at the end of an unfinished capture
+				break
+			
+			if compression:
+				if compression not in decompressors:
+					decompressors[compression] = capture_codec(compression)[1]
+				data = decompressors[compression](self.view[start:start+length])
+			else:
+				data = self.view[start:start+length]
+			
+			yield offset, data
+			offset = start + length
+	
+	def rebuild_index(self):
+		self.index = []
+		for offset, data in self.blocks(capture_header.size):
+			pos = 0
+			while pos < len(data):
+				ts, kind, sid, length = capture_record_header.unpack_from(data, pos)
+				if kind == CAPTURE_ITERATION:
+					pos += capture_record_header.size
+					self.index.append((int(bytes(data[pos:pos+length])), offset))
+					break
+				if kind != CAPTURE_SOURCE:
+					break
+				pos += capture_record_header.size + length
+	
+	# yields (ts, kind, source, payload) starting with the given iteration
+	def records(self, first=None, last=None):
+		offset = capture_header.size
+		if first is not None:
+			for iteration, block_offset in self.index:
+				if iteration >= first:
+					offset = block_offset
+					break
+			else:
+				return
+		
+		sources = {}
+		for block_offset, data in self.blocks(offset):
+			pos = 0
+			while pos < len(data):
+				ts, kind, sid, length = capture_record_header.unpack_from(data, pos)
+				pos += capture_record_header.size
+				payload = bytes(data[pos:pos+length])
+				pos += length
+				
+				if kind == CAPTURE_SOURCE:
+					sources[sid] = payload.decode()
+					continue
+				
+				if kind == CAPTURE_ITERATION and last is not None and int(payload) > last:
+					return
+				
+				yield ts, capture_kind_names[kind], sources[sid], payload
+
+# An agent streams the events of its measurement to a collector. The stream
+# consists of frames that start with the length of the frame. Every frame
+# contains a batch of records with a timestamp, the kind of the record and the
+# length of the payload. The payload of the hello record consists of the name
+# of the agent, its config hash, firmware revision, tag and the offset of its
+# clock to the wall clock separated by NUL. The timestamp of a value record is
+# the time of the mpoint that completed the value.
+AGENT_HELLO, AGENT_ITERATION, AGENT_POWER, AGENT_VALUE, AGENT_LINE = range(5)
+AGENT_BATCH_SIZE = 16 * 1024
+AGENT_FLUSH_INTERVAL = 0.2
+AGENT_MAX_PENDING = 16 * 1024 * 1024
+
+agent_frame_header = struct.Struct("<I")
+agent_record_header = struct.Struct("<qBI")
+agent_value = struct.Struct("<d")
+
+# parse "unix:PATH" or "HOST:PORT" and return the socket family and address
+def agent_address(address):
+	if address.startswith("unix:"):
+		return socket.AF_UNIX, address[len("unix:"):]
+	
+	host, sep, port = address.rpartition(":")
+	if not sep or not port.isdigit():
+		bsprint("error, invalid address", address, "(expected unix:PATH or HOST:PORT)", file=sys.stderr)
+		sys.exit(1)
+	
+	return socket.AF_INET, (host.strip("[]"), int(port))
+
+class AgentConnection():
+	def __init__(self, address, name, config_hash, revision, tag):
+		family, addr = agent_address(address)
+		
+		try:
+			if family == socket.AF_UNIX:
+				self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+				self.sock.connect(addr)
+			else:
+				self.sock = socket.create_connection((addr[0] or "localhost", addr[1]))
+				self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		except OSError as exc:
+			bsprint("error, cannot connect to collector %s:" % address, exc, file=sys.stderr)
+			sys.exit(1)
+		
+		# records are only added by the event loop, which must not block while
+		# the collector is slow. Frames that cannot be sent immediately are kept
+		# in self.pending and written once the socket becomes writable again.
+		self.sock.setblocking(False)
+		self.loop = None
+		self.writing = False
+		self.batch = bytearray()
+		self.pending = bytearray()
+		self.dropped = 0
+		
+		hello = "\0".join((name, config_hash, revision or "", tag or "", str(clock_offset_ns)))
+		self.send(clock_ns(), AGENT_HELLO, hello.encode())
+		self.flush()
+	
+	def send(self, ts, kind, payload):
+		self.batch += agent_record_header.pack(ts, kind, len(payload))
+		self.batch += payload
+		
+		if len(self.batch) >= AGENT_BATCH_SIZE:
+			self.flush()
+	
+	def sendValue(self, name, value, ts):
+		self.send(ts, AGENT_VALUE, agent_value.pack(value) + name.encode())
+	
+	def flush(self):
+		if not self.batch or not self.sock:
+			return
+		
+		if len(self.pending) > AGENT_MAX_PENDING:
+			# the collector does not keep up, drop whole frames to keep the
+			# stream parseable and our memory usage bounded
+			self.dropped += 1
+			bsprint("error, collector does not keep up, dropped %d record batches" % self.dropped, file=sys.stderr)
+			self.batch = bytearray()
+			return
+		
+		self.pending += agent_frame_header.pack(len(self.batch))
+		self.pending += self.batch
+		self.batch = bytearray()
+		
+		self.write()
+	
+	def write(self):
+		if not self.sock:
+			return
+		
+		# without a running event loop (e.g. while replaying a capture) there
+		# is nothing else to do, so we simply wait for the collector
+		blocking = not (self.loop and self.loop.is_running())
+		
+		try:
+			self.sock.setblocking(blocking)
+			while self.pending:
+				sent = self.sock.send(self.pending)
+				del self.pending[:sent]
+		except (BlockingIOError, InterruptedError):
+			pass
+		except OSError as exc:
+			bsprint("error, lost connection to collector:", exc, file=sys.stderr)
+			self.disconnect()
+			return
+		
+		if self.pending and not self.writing:
+			self.loop.add_writer(self.sock, self.write)
+			self.writing = True
+		elif not self.pending and self.writing:
+			self.loop.remove_writer(self.sock)
+			self.writing = False
+	
+	def stop_writing(self):
+		if self.writing and not self.loop.is_closed():
+			self.loop.remove_writer(self.sock)
+		self.writing = False
+	
+	def disconnect(self):
+		self.stop_writing()
+		self.sock.close()
+		self.sock = None
+		self.pending = bytearray()
+	
+	# send incomplete batches after a short time
+	def flush_periodically(self, loop):
+		self.loop = loop
+		self.flush()
+		
+		loop.call_later(AGENT_FLUSH_INTERVAL, self.flush_periodically, loop)
+	
+	def close(self):
+		self.flush()
+		
+		if not self.sock:
+			return
+		
+		# the event loop is stopped, so this sends the remainder blocking
+		self.stop_writing()
+		self.write()
+		
+		if self.sock:
+			self.disconnect()
+
+# seconds to wait for the triggered acquisition before a power command with
+# --sr-idle-samplerate
+SR_ARM_TIMEOUT = 1.0
+
+# Converts the index of a sigrok sample into a timestamp of the host clock.
+# The samples are delivered in packets some time after they were taken. The
+# first packet anchors the sample clock to the host clock. Afterwards, the
+# packet with the lowest delay within every resync period is used to correct
+# the anchor, which compensates jitter of the USB transfers as well as the
+# drift between the clock of the probe and the host clock.
+class SampleClock():
+	def __init__(self, samplerate, resync):
+		self.period = NS_PER_SEC / samplerate
+		self.resync = resync
+		
+		# host time of the first sample
+		self.anchor_ts = None
+		self.samples = 0
+		
+		self.window_ts = None
+		self.min_offset = None
+		
+		self.resyncs = 0
+		self.max_correction = 0
+		
+		# see settle()
+		self.first_delay = 0
+		self.acquisitions = 0
+	
+	def ts(self, index):
+		return int(self.anchor_ts + index * self.period)
+	
+	# called after a packet with n samples was received at host time ts
+	def packet(self, n, ts):
+		self.samples += n
+		
+		if self.anchor_ts is None:
+			self.anchor_ts = ts - self.samples * self.period - self.first_delay
+			self.window_ts = ts
+			return
+		
+		# the delay of this packet relative to the delay of the anchor
+		offset = ts - (self.anchor_ts + self.samples * self.period)
+		if self.min_offset is None or offset < self.min_offset:
+			self.min_offset = offset
+		
+		if ts - self.window_ts >= self.resync:
+			self.anchor_ts += self.min_offset
+			
+			self.resyncs += 1
+			if abs(self.min_offset) > self.max_correction:
+				self.max_correction = abs(self.min_offset)
+			
+			self.window_ts = ts
+			self.min_offset = None
+	
+	# With --sr-trigger, every acquisition restarts the sample index of the
+	# device and the clock is anchored again by the first packet of the next
+	# acquisition. With --sr-idle-samplerate, the sample rate changes as well.
+	def restart(self, samplerate=None):
+		if samplerate:
+			self.period = NS_PER_SEC / samplerate
+		self.anchor_ts = None
+		self.samples = 0
+		self.min_offset = None
+	
+	# The first packet of an acquisition usually arrives later than the
+	# following ones as it also contains the samples before the trigger.
+	# After every acquisition, this excess delay is measured against the
+	# packet with the lowest delay and its average corrects the anchor of
+	# the next acquisition.
+	def settle(self):
+		if self.min_offset is None:
+			return
+		
+		excess = max(0, self.first_delay - self.min_offset)
+		self.acquisitions += 1
+		self.first_delay += (excess - self.first_delay) / self.acquisitions
+		self.min_offset = None
+
+# NumPy is optional. Without it, bytes.translate() and bytes.find() are used
+# which also process the samples in C.
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# maps every byte to b"\x00" or b"\x01" depending on the given bit
+logic_tables = [bytes((b >> bit) & 1 for b in range(256)) for bit in range(8)]
+
+# Find the transitions of a channel in the payload of a sigrok logic packet.
+# Every sample consists of unitsize bytes with one bit per channel. Returns
+# a list with the index of the sample and the new state of every transition
+# as well as the state of the last sample. The first sample is compared to
+# the last state of the previous packet, if any.
+def logic_edges_numpy(data, unitsize, channel, last):
+	samples = numpy.frombuffer(data, dtype=numpy.uint8)[channel // 8::unitsize]
+	if len(samples) == 0:
+		return [], last
+	
+	states = (samples & (1 << (channel % 8))) != 0
+	if last is None:
+		last = int(states[0])
+	
+	edges = []
+	if states[0] != last:
+		edges.append((0, int(states[0])))
+	
+	changes = numpy.flatnonzero(states[1:] ^ states[:-1]) + 1
+	edges += [(int(i), int(states[i])) for i in changes]
+	
+	return edges, int(states[-1])
+
+def logic_edges_bytes(data, unitsize, channel, last):
+	states = bytes(memoryview(data).cast("B")[channel // 8::unitsize]).translate(logic_tables[channel % 8])
+	if not states:
+		return [], last
+	
+	if last is None:
+		last = states[0]
+	
+	edges = []
+	pos = states.find(b"\x00" if last else b"\x01")
+	while pos >= 0:
+		last ^= 1
+		edges.append((pos, last))
+		pos = states.find(b"\x00" if last else b"\x01", pos)
+	
+	return edges, states[-1]
+
+logic_edges = logic_edges_numpy if numpy is not None else logic_edges_bytes
+
+# keep the samples of the last seconds to look up the energy at the time of
+# a mpoint as lines and samples arrive with different delays
+ENERGY_KEEP_NS = 5 * NS_PER_SEC
+# how long to wait for the samples of the last lookups after the measurement
+ENERGY_DRAIN_NS = 2 * NS_PER_SEC
+
+# Integrates the power measured by a sigrok channel while the samples arrive.
+# Instead of the samples, only the cumulative energy of the last seconds is
+# kept, so the memory does not grow with the duration of the measurement.
+# Lookups for timestamps without samples yet wait for the next packets. The
+# result of a lookup is passed to the resolved callback.
+class EnergyMeter():
+	def __init__(self, resolved):
+		self.resolved = resolved
+		self.lock = threading.Lock()
+		
+		self.total = 0.0
+		self.last_ts = None
+		self.blocks = collections.deque()
+		self.pending = []
+	
+	# add the power values (in watts) of a packet that ended at end_ts. If
+	# period is None, the samples are spread evenly since the last packet.
+	def add(self, values, end_ts, period=None):
+		n = len(values)
+		if n == 0:
+			return
+		
+		if period is None:
+			if self.last_ts is None:
+				self.last_ts = end_ts
+				return
+			period = (end_ts - self.last_ts) / n
+		
+		cum = self.total + numpy.cumsum(values, dtype=numpy.float64) * (period / NS_PER_SEC)
+		first_ts = end_ts - (n - 1) * period
+		
+		with self.lock:
+			self.blocks.append((first_ts, period, cum))
+			self.total = float(cum[-1])
+			self.last_ts = end_ts
+			
+			while len(self.blocks) > 1 and end_ts - self.blocks[0][0] > ENERGY_KEEP_NS:
+				self.blocks.popleft()
+			
+			resolved = [(key, self.energy_at(ts)) for key, ts in self.pending if ts <= end_ts]
+			self.pending = [(key, ts) for key, ts in self.pending if ts > end_ts]
+		
+		for key, joules in resolved:
+			self.resolved(key, joules)
+	
+	def energy_at(self, ts):
+		for first_ts, period, cum in reversed(self.blocks):
+			if ts >= first_ts:
+				return float(cum[min(int((ts - first_ts) / period), len(cum) - 1)])
+		
+		# older than the kept samples
+		if self.blocks:
+			return float(self.blocks[0][2][0])
+		return 0.0
+	
+	# look up the energy that was consumed until ts
+	def lookup(self, key, ts):
+		with self.lock:
+			if self.last_ts is None or ts > self.last_ts:
+				self.pending.append((key, ts))
+				return
+			
+			joules = self.energy_at(ts)
+		
+		self.resolved(key, joules)
+	
+	# resolve the remaining lookups with the last samples
+	def flush(self):
+		with self.lock:
+			resolved = [(key, self.energy_at(ts)) for key, ts in self.pending]
+			self.pending = []
+		
+		for key, joules in resolved:
+			self.resolved(key, joules)
+
+# regularized incomplete beta function I_x(a, b) using its continued
+# fraction, see Numerical Recipes, chapter 6.4
+def betainc(a, b, x):
+	if x <= 0:
+		return 0.0
+	if x >= 1:
+		return 1.0
+	
+	# the continued fraction converges quickly only for small x
+	if x > (a + 1) / (a + b + 2):
+		return 1.0 - betainc(b, a, 1 - x)
+	
+	front = exp(lgamma(a + b) - lgamma(a) - lgamma(b) + a * log(x) + b * log(1 - x)) / a
+	
+	tiny = 1e-300
+	c = 1.0
+	d = 1.0 - (a + b) * x / (a + 1)
+	if abs(d) < tiny:
+		d = tiny
+	d = 1.0 / d
+	f = d
+	for m in range(1, 200):
+		for numerator in (
+				m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+				-(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1)),
+				):
+			d = 1.0 + numerator * d
+			if abs(d) < tiny:
+				d = tiny
+			c = 1.0 + numerator / c
+			if abs(c) < tiny:
+				c = tiny
+			d = 1.0 / d
+			f *= c * d
+		
+		if abs(c * d - 1.0) < 1e-12:
+			break
+	
+	return front * f
+
+# probability that a t-distributed value is larger than t
+def t_sf(t, df):
+	p = 0.5 * betainc(df / 2, 0.5, df / (df + t * t))
+	if t < 0:
+		p = 1 - p
+	return p
+
+# value t with P(T <= t) = p of the t-distribution, using bisection
+def t_quantile(p, df):
+	low, high = 0.0, 1000.0
+	for i in range(60):
+		mid = (low + high) / 2
+		if 1 - t_sf(mid, df) < p:
+			low = mid
+		else:
+			high = mid
+	return (low + high) / 2
+
+# Welch's t-test if the mean of sample a is larger than the mean of sample b.
+# Expects the mean, the sample standard deviation and the number of values of
+# both samples and returns t, the degrees of freedom and the one-sided p-value.
+def welch_test(mean_a, dev_a, n_a, mean_b, dev_b, n_b):
+	if n_a < 2 or n_b < 2:
+		return None
+	
+	var_a = dev_a ** 2 / n_a
+	var_b = dev_b ** 2 / n_b
+	if var_a + var_b == 0:
+		# no variation at all, every difference is significant
+		if mean_a > mean_b:
+			return (float("inf"), n_a + n_b - 2, 0.0)
+		return (float("-inf") if mean_a < mean_b else 0.0, n_a + n_b - 2, 1.0)
+	
+	t = (mean_a - mean_b) / (var_a + var_b) ** 0.5
+	df = (var_a + var_b) ** 2 / (var_a ** 2 / (n_a - 1) + var_b ** 2 / (n_b - 1))
+	
+	return (t, df, t_sf(t, df))
+
+# number of values that are written to the database in one transaction
+STORE_BATCH_SIZE = 1000
+
+# Stores the value of every mpoint and interval of every iteration in a
+# SQLite database. Every measurement (or every board of a pool and every
+# agent of a collector) is a run with the hash of the trigger configuration
+# and the revision or tag of the measured firmware.
+class ResultStore():
+	def __init__(self, path):
+		import sqlite3
+		
+		self.db = sqlite3.connect(path, timeout=30)
+		self.pending = []
+		
+		self.db.executescript("""
+			CREATE TABLE IF NOT EXISTS runs (
+				id INTEGER PRIMARY KEY,
+				started REAL,
+				finished REAL,
+				host TEXT,
+				board TEXT,
+				config_hash TEXT,
+				revision TEXT,
+				tag TEXT,
+				iterations INTEGER
+				);
+			CREATE TABLE IF NOT EXISTS results (
+				run INTEGER NOT NULL REFERENCES runs(id),
+				iteration INTEGER NOT NULL,
+				mpoint TEXT NOT NULL,
+				value REAL NOT NULL,
+				ts REAL
+				);
+			CREATE INDEX IF NOT EXISTS results_mpoint ON results (mpoint, run);
+			CREATE INDEX IF NOT EXISTS results_run ON results (run, iteration);
+			CREATE INDEX IF NOT EXISTS runs_tag ON runs (tag, id);
+			CREATE INDEX IF NOT EXISTS runs_revision ON runs (revision, id);
+			""")
+	
+	def startRun(self, board, config_hash, revision, tag):
+		with self.db:
+			cursor = self.db.execute(
+				"INSERT INTO runs (started, host, board, config_hash, revision, tag) VALUES (?, ?, ?, ?, ?, ?)",
+				(time.time(), socket.gethostname(), board, config_hash, revision, tag))
+		return cursor.lastrowid
+	
+	# ts is the time of the measurement in seconds since the epoch
+	def add(self, run, iteration, mpoint, value, ts):
+		self.pending.append((run, iteration, mpoint, value, ts))
+		
+		if len(self.pending) >= STORE_BATCH_SIZE:
+			self.flush()
+	
+	def flush(self):
+		if not self.pending:
+			return
+		
+		with self.db:
+			self.db.executemany("INSERT INTO results VALUES (?, ?, ?, ?, ?)", self.pending)
+		self.pending = []
+	
+	def finishRun(self, run):
+		self.flush()
+		with self.db:
+			self.db.execute(
+				"UPDATE runs SET finished = ?, iterations = (SELECT count(DISTINCT iteration) FROM results WHERE run = ?) WHERE id = ?",
+				(time.time(), run, run))
+	
+	# returns the values of a mpoint grouped by the last builds, i.e., by
+	# the tag or, if there is no tag, the revision of the firmware
+	def builds(self, mpoint, count):
+		cursor = self.db.execute("""
+			SELECT coalesce(runs.tag, runs.revision, '') AS build, max(runs.id) AS last
+			FROM runs
+			GROUP BY build
+			ORDER BY last DESC
+			LIMIT ?
+			""", (count,))
+		builds = { build: [] for build, last in reversed(cursor.fetchall()) }
+		
+		cursor = self.db.execute("""
+			SELECT coalesce(runs.tag, runs.revision, '') AS build, results.value
+			FROM results JOIN runs ON runs.id = results.run
+			WHERE results.mpoint = ? AND results.run IN (
+				SELECT id FROM runs WHERE coalesce(tag, revision, '') IN (
+					SELECT coalesce(tag, revision, '') AS build
+					FROM runs
+					GROUP BY build
+					ORDER BY max(id) DESC
+					LIMIT ?
+					)
+				)
+			""", (mpoint, count))
+		for build, value in cursor:
+			# a run could have been added in the meantime
+			if build in builds:
+				builds[build].append(value)
+		return builds
+	
+	def close(self):
+		self.flush()
+		self.db.close()
+
+# hash of the trigger and interval definitions to find comparable runs
+def config_hash():
+	import hashlib
+	
+	h = hashlib.sha256()
+	if args.trigger:
+		h.update(args.trigger.encode())
+	for sect in sorted(config.sections()):
+		if sect.startswith("trigger_") or sect.startswith("interval_"):
+			h.update(sect.encode())
+			for key, value in sorted(config[sect].items()):
+				h.update(("\0%s=%s" % (key, value)).encode())
+	return h.hexdigest()[:16]
+
+# revision of the measured firmware, either given directly or the git
+# revision of the firmware's source tree. Without both, the revision is
+# unknown as the current directory is not necessarily related to the firmware.
+def firmware_revision():
+	if args.revision:
+		return args.revision
+	if not args.firmware_dir:
+		return None
+	
+	import subprocess
+	
+	try:
+		return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=args.firmware_dir, stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		bsprint("error, cannot get the git revision of", args.firmware_dir, file=sys.stderr)
+		sys.exit(1)
+
+def benchmark_match():
+	import random
+	
+	rnd = random.Random(0)
+	words = [b"usb", b"eth0", b"mmc0", b"ubi0", b"phy", b"clk", b"irq", b"dma",
+		b"attached", b"registered", b"Link is Up", b"new device", b"probe",
+		b"driver", b"failed", b"kernel", b"init", b"Starting", b"version"]
+	
+	triggers = []
+	while len(triggers) < 150:
+		trigger = b" ".join(rnd.sample(words, 2)) + (" %d" % len(triggers)).encode()
+		triggers.append(trigger)
+	
+	lines = []
+	for i in range(20000):
+		line = b"[%5d.%06d] " % (i // 1000, i % 1000000) + b" ".join(rnd.choices(words, k=8))
+		if i % 100 == 0:
+			line += b" " + rnd.choice(triggers)
+		lines.append(line)
+	
+	mpoints = { "trigger_%d" % i: { "trigger": trigger } for i, trigger in enumerate(triggers) }
+	
+	matcher = TriggerMatcher()
+	for mname, mdict in mpoints.items():
+		matcher.add(mdict["trigger"], mname)
+	
+	ts = time.perf_counter()
+	matcher.compile()
+	compile_time = time.perf_counter() - ts
+	
+	ts = time.perf_counter()
+	loop_hits = []
+	for line in lines:
+		hits = set()
+		for mname, mdict in mpoints.items():
+			if line.find(mdict["trigger"]) > -1:
+				hits.add(mname)
+		loop_hits.append(hits)
+	loop_time = time.perf_counter() - ts
+	
+	ts = time.perf_counter()
+	matcher_hits = []
+	for line in lines:
+		matcher_hits.append(matcher.search(line))
+	matcher_time = time.perf_counter() - ts
+	
+	if loop_hits != matcher_hits:
+		print("error, results of the matcher differ from the reference loop", file=sys.stderr)
+		sys.exit(1)
+	
+	print("%d triggers, %d lines, %d matches" % (len(triggers), len(lines), sum(len(h) for h in loop_hits)))
+	print("%-20s %10.6f s %10.0f lines/s" % ("find() loop", loop_time, len(lines) / loop_time))
+	print("%-20s %10.6f s %10.0f lines/s (compiled in %.6f s)" % ("Aho-Corasick", matcher_time, len(lines) / matcher_time, compile_time))
+
+# delete table for bytes.translate() that strips all control characters
+uart_control_chars = bytes(range(32))
+
+# Splits a block of received UART data into lines using bulk operations. buf
+# contains the incomplete line of the previous block and is prepended to the
+# first line. Returns the completed lines without control characters and the
+# incomplete rest of data.
+def uart_split_lines(buf, data):
+	lines = data.split(b"\n")
+	tail = lines.pop()
+	if lines:
+		lines[0] = buf + lines[0]
+	
+	return [line.translate(None, uart_control_chars) for line in lines], tail
+
+# Estimates the arrival time of every newline in a block of UART data. The last
+# byte of data arrived at read_ts and every byte before it char_time (in ns)
+# earlier. Returns one timestamp per newline in data.
+def uart_estimate_ts(data, read_ts, char_time):
+	result = []
+	end = len(data)
+	while True:
+		idx = data.rfind(b"\n", 0, end)
+		if idx < 0:
+			break
+		result.append(read_ts - int((len(data) - 1 - idx) * char_time))
+		end = idx
+	result.reverse()
+	
+	return result
+
+# Turns blocks of UART data into timestamped lines and passes them to
+# push_lines(). The timestamp of a block is the time it was read from the
+# kernel, lines that started in a previous block get the timestamp of that
+# block.
+class UartLineSplitter():
+	def __init__(self, push_lines, run):
+		self.push_lines = push_lines
+		self.run = run
+		self.char_time = None
+		self.reset()
+	
+	def reset(self):
+		self.buf = b""
+		self.last_buf_ts = None
+		self.last_ts = None
+	
+	def set_port(self, ser):
+		# start bit, data bits, optional parity bit (serial.PARITY_NONE is "N")
+		# and stop bits
+		bits_per_char = 1 + ser.bytesize + (ser.parity != "N") + ser.stopbits
+		self.char_time = bits_per_char * NS_PER_SEC / ser.baudrate
+	
+	def process(self, data, ts):
+		global delta_min, ts_correction_max, ts_correction_sum, ts_correction_lines
+		
+		if self.last_ts and (delta_min is None or ts - self.last_ts < delta_min):
+			delta_min = ts - self.last_ts
+		self.last_ts = ts
+		
+		if args.verbose > 1:
+			bsprint("UART RX %d bytes" % len(data), ts=ts)
+		
+		new_lines, tail = uart_split_lines(self.buf, data)
+		if new_lines:
+			if self.run.measuring:
+				lines = [[ts, line] for line in new_lines]
+				
+				# the kernel buffer might contain multiple lines, hence we
+				# calculate back when each line was received
+				estimate = args.estimate_line_ts and self.char_time
+				if estimate:
+					for line, line_ts in zip(lines, uart_estimate_ts(data, ts, self.char_time)):
+						line[0] = line_ts
+				
+				# the first line started in a previous block
+				if self.buf:
+					lines[0][0] = self.last_buf_ts
+					self.last_buf_ts = None
+				
+				# statistics of the timestamps that are actually used
+				if estimate:
+					correction = ts - lines[0][0]
+					if ts_correction_max is None or correction > ts_correction_max:
+						ts_correction_max = correction
+					ts_correction_sum += sum(ts - line[0] for line in lines)
+					ts_correction_lines += len(lines)
+					
+					if args.verbose > 1:
+						bsprint("UART RX %d lines, max correction %.6f" % (len(lines), correction / NS_PER_SEC), ts=ts)
+				
+				self.push_lines(lines, "serial")
+			
+			self.buf = b""
+		
+		if self.run.flush_input:
+			return
+		
+		if tail:
+			self.buf += tail
+			if self.last_buf_ts is None:
+				self.last_buf_ts = ts
+
+def benchmark_uart_split():
+	import random
+	
+	rnd = random.Random(0)
+	
+	# console output with CRLF line endings and some escape sequences as
+	# received with 3 Mbaud
+	stream = []
+	size = 0
+	while size < 4 * 1024 * 1024:
+		line = b"[%5d.%06d] " % (rnd.randint(0, 99999), rnd.randint(0, 999999))
+		line += bytes(rnd.choices(range(32, 127), k=rnd.randint(10, 120)))
+		if rnd.random() < 0.05:
+			line = b"\x1b[0;32m" + line + b"\x1b[0m"
+		stream.append(line + b"\r\n")
+		size += len(stream[-1])
+	stream = b"".join(stream)
+	
+	# with 3 Mbaud, we receive ~300 bytes per millisecond
+	blocks = []
+	offset = 0
+	while offset < len(stream):
+		size = rnd.randint(1, 4096)
+		blocks.append(stream[offset:offset+size])
+		offset += size
+	
+	def loop_split(buf, data):
+		lines = []
+		last_newline = 0
+		for i in range(len(data)):
+			if data[i] == ord("\n"):
+				line = buf + data[last_newline:i]
+				line = bytes(filter(lambda x: x >= 32, line))
+				lines.append(line)
+				buf = b""
+				last_newline = i+1
+		
+		return lines, data[last_newline:]
+	
+	results = {}
+	for name, func in (("per-byte loop", loop_split), ("split/translate", uart_split_lines)):
+		ts = time.perf_counter()
+		buf = b""
+		lines = []
+		for data in blocks:
+			new_lines, tail = func(buf, data)
+			if new_lines:
+				buf = b""
+			lines.extend(new_lines)
+			buf += tail
+		duration = time.perf_counter() - ts
+		
+		results[name] = lines
+		print("%-20s %10.6f s %10.1f MB/s %10.2f us/block" % (name, duration, len(stream) / duration / 1e6, duration / len(blocks) * 1e6))
+	
+	if results["per-byte loop"] != results["split/translate"]:
+		print("error, split results differ from the reference loop", file=sys.stderr)
+		sys.exit(1)
+	
+	print("%d bytes, %d blocks, %d lines" % (len(stream), len(blocks), len(results["per-byte loop"])))
+
+# Measures the latency and jitter of the different UART reader modes. A thread
+# writes the same synthetic stream into a pseudo terminal for every mode while
+# the event loop is kept busy periodically like during trigger matching.
+def benchmark_serial_readers():
+	import serial, select, random, types
+	
+	count = 2000
+	load_period = 0.005
+	load_duration = 0.001
+	
+	rnd = random.Random(0)
+	gaps = []
+	for i in range(count):
+		# bursts of lines like during the kernel boot and single lines with pauses
+		if rnd.random() < 0.3:
+			gaps.append(0)
+		else:
+			gaps.append(rnd.uniform(0, 0.002))
+	
+	def loop_load(loop):
+		end = time.perf_counter() + load_duration
+		while time.perf_counter() < end:
+			pass
+		loop.call_later(load_period, loop_load, loop)
+	
+	def reader_thread(path, splitter, stop):
+		ser = serial.Serial(path, timeout=0)
+		while not stop.is_set():
+			r, w, e = select.select([ser.fileno()], [], [], 0.1)
+			if ser.fileno() in r:
+				data = ser.read(ser.in_waiting)
+				splitter.process(data, clock_ns())
+		ser.close()
+	
+	def run(mode):
+		master, slave = os.openpty()
+		path = os.ttyname(slave)
+		
+		received = []
+		send_ts = [None] * count
+		splitter = UartLineSplitter(
+			lambda lines, source: received.extend(lines),
+			types.SimpleNamespace(measuring=True, flush_input=False),
+			)
+		
+		loop = asyncio.new_event_loop()
+		stop = threading.Event()
+		cleanup = []
+		
+		if mode == "thread":
+			thread = threading.Thread(target=reader_thread, args=(path, splitter, stop))
+			thread.start()
+			cleanup.append(thread.join)
+		elif mode == "serial-asyncio":
+			import serial_asyncio
+			
+			class Output(asyncio.Protocol):
+				def data_received(self, data):
+					splitter.process(data, clock_ns())
+			
+			transport, protocol = loop.run_until_complete(
+				serial_asyncio.create_serial_connection(loop, Output, path))
+			cleanup.append(transport.close)
+		elif mode == "fd":
+			ser = serial.Serial(path, timeout=0)
+			loop.add_reader(ser.fileno(), lambda: splitter.process(ser.read(ser.in_waiting), clock_ns()))
+			cleanup.append(ser.close)
+			cleanup.append(lambda: loop.remove_reader(ser.fileno()))
+		
+		def writer():
+			time.sleep(0.2)
+			for seq in range(count):
+				if gaps[seq]:
+					time.sleep(gaps[seq])
+				send_ts[seq] = clock_ns()
+				os.write(master, b"%06d [    1.000000] synthetic console output\r\n" % seq)
+			
+			time.sleep(0.2)
+			loop.call_soon_threadsafe(loop.stop)
+		
+		writer_thread = threading.Thread(target=writer)
+		writer_thread.start()
+		loop.call_soon(loop_load, loop)
+		loop.run_forever()
+		writer_thread.join()
+		
+		stop.set()
+		for func in reversed(cleanup):
+			func()
+		loop.run_until_complete(asyncio.sleep(0))
+		loop.close()
+		os.close(master)
+		os.close(slave)
+		
+		latencies = sorted((ts - send_ts[int(line[:6])]) / 1000 for ts, line in received)
+		
+		return latencies
+	
+	print("%d lines, event loop busy for %.1f ms every %.1f ms" % (count, load_duration * 1000, load_period * 1000))
+	print("%-16s %8s %10s %10s %10s %10s %10s" % ("mode", "lines", "avg us", "p50 us", "p99 us", "max us", "jitter us"))
+	for mode in ("thread", "serial-asyncio", "fd"):
+		try:
+			latencies = run(mode)
+		except ImportError as exc:
+			print("%-16s skipped: %s" % (mode, exc))
+			continue
+		
+		if not latencies:
+			print("%-16s no lines received" % mode)
+			continue
+		
+		avg = sum(latencies) / len(latencies)
+		jitter = (sum((l - avg) ** 2 for l in latencies) / len(latencies)) ** 0.5
+		print("%-16s %8d %10.1f %10.1f %10.1f %10.1f %10.1f" % (
+			mode, len(latencies), avg,
+			latencies[len(latencies) // 2],
+			latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+			latencies[-1], jitter,
+			))
+
+# compare the decoding of sigrok logic packets as CSV text and as bytes
+def benchmark_sigrok_logic():
+	import random
+	
+	unitsize = 1
+	packet_samples = 1 << 20
+	packets = 16
+	channel = 3
+	
+	# a power channel with few transitions and noise on the other channels
+	rnd = random.Random(0)
+	data = []
+	state = 0
+	for i in range(packets):
+		packet = bytearray(rnd.randbytes(packet_samples * unitsize))
+		pos = 0
+		for edge in sorted(rnd.sample(range(packet_samples), 4)):
+			for j in range(pos, edge):
+				packet[j * unitsize] = (packet[j * unitsize] & ~(1 << channel)) | (state << channel)
+			state ^= 1
+			pos = edge
+		for j in range(pos, packet_samples):
+			packet[j * unitsize] = (packet[j * unitsize] & ~(1 << channel)) | (state << channel)
+		data.append(bytes(packet))
+	
+	# the CSV output of sigrok with only the power channel enabled
+	csv_data = ["\n".join("1" if b & (1 << channel) else "0" for b in packet[::unitsize]) for packet in data]
+	
+	def csv_decode():
+		n_edges = 0
+		lastline = None
+		for lines in csv_data:
+			for line in lines.split("\n"):
+				if not line:
+					continue
+				if lastline is not None and lastline != line:
+					n_edges += 1
+				lastline = line
+		return n_edges
+	
+	def logic_decode(decoder):
+		n_edges = 0
+		last = None
+		for packet in data:
+			edges, last = decoder(packet, unitsize, channel, last)
+			n_edges += len(edges)
+		return n_edges
+	
+	modes = [("csv", csv_decode)]
+	if numpy is not None:
+		modes.append(("logic numpy", lambda: logic_decode(logic_edges_numpy)))
+	modes.append(("logic bytes", lambda: logic_decode(logic_edges_bytes)))
+	
+	print("%-16s %10s %8s" % ("mode", "MSamples/s", "edges"))
+	for mode, decode in modes:
+		start = time.perf_counter()
+		n_edges = decode()
+		elapsed = time.perf_counter() - start
+		
+		print("%-16s %10.1f %8d" % (mode, packets * packet_samples / elapsed / 1e6, n_edges))
+	
+	try:
+		import sigrok.core as sr
+		from sigrok.core.classes import ConfigKey, PacketType
+	except ImportError:
+		print("sigrok python bindings not available, skipping demo driver")
+		return
+	
+	# decode the logic packets of sigrok's demo driver as fast as it delivers them
+	samplerate = 50000000
+	limit = 200000000
+	
+	context = sr.Context_create()
+	device = context.drivers["demo"].scan()[0]
+	device.open()
+	device.config_set(ConfigKey.SAMPLERATE, samplerate)
+	device.config_set(ConfigKey.LIMIT_SAMPLES, limit)
+	for ch in device.channels:
+		ch.enabled = ch.name.startswith("D")
+	
+	n_samples = 0
+	n_edges = 0
+	last = None
+	def datafeed(device, packet):
+		nonlocal n_samples, n_edges, last
+		
+		if packet.type != PacketType.LOGIC:
+			return
+		
+		payload = packet.payload
+		edges, last = logic_edges(payload.data, payload.unit_size, 0, last)
+		n_samples += len(payload.data) // payload.unit_size
+		n_edges += len(edges)
+	
+	session = context.create_session()
+	session.add_device(device)
+	session.start()
+	session.add_datafeed_callback(datafeed)
+	
+	start = time.perf_counter()
+	session.run()
+	elapsed = time.perf_counter() - start
+	
+	session.stop()
+	device.close()
+	
+	print("%-16s %10.1f %8d" % ("demo driver", n_samples / elapsed / 1e6, n_edges))
+
+benchmarks = {
+	"match": benchmark_match,
+	"uart-split": benchmark_uart_split,
+	"serial-readers": benchmark_serial_readers,
+	"sigrok-logic": benchmark_sigrok_logic,
+	}
+
 parser = argparse.ArgumentParser()
 
 # sigrok options
@@ -70,17 +1871,38 @@ parser.add_argument("--sr_channels")
 parser.add_argument("--sr_samplerate")
 parser.add_argument("--sr_scan", action="store_true", help="only show available devices for sigrok")
 parser.add_argument("--sr-monitor", action="store_true", help="only dump events of the given sigrok channels")
+parser.add_argument("--sr-trigger", action="store_true", help="only acquire samples around power transitions using the trigger of the sigrok device")
+parser.add_argument("--sr-trigger-window", default=0.1, help="duration in seconds of the acquisition after every power transition with --sr-trigger")
+parser.add_argument("--sr-idle-samplerate", help="with --sr-trigger, sample at this low rate while no power command is running instead of waiting for the trigger at the full rate, e.g., for devices that evaluate triggers in software")
+parser.add_argument("--sr-power-channel", help="analog sigrok channel that measures the power (W) of the device to calculate the energy of every boot stage")
+parser.add_argument("--sr-current-channel", help="analog sigrok channel that measures the current (A) of the device, requires --supply-voltage")
+parser.add_argument("--supply-voltage", help="supply voltage of the device for --sr-current-channel")
+parser.add_argument("--sr-resync", default=10, help="interval in seconds to synchronize the sample clock of sigrok with the host clock")
 
 parser.add_argument("--poweron", default="", help="command to power on the device")
 parser.add_argument("--poweroff", default="", help="command to power off the device")
 parser.add_argument("--manual-power", action="store_true", help="this application will wait until the device is powered on or off")
 parser.add_argument("--sysrq-reboot", action="store_true", help="Send SYSRQ reboot sequence to restart device (not recommended)")
+parser.add_argument("--power-backend", help="use the power_NAME.py backend instead of the poweron and poweroff commands")
+parser.add_argument("--power-timeout", default=10, help="maximum time in seconds a power command may take")
+parser.add_argument("--power-on-edge", default="end", choices=["start", "end"], help="without sigrok, the device is considered powered on when the power-on command is started or when it finished")
 
 parser.add_argument("--serial-device", default="/dev/ttyUSB0")
 parser.add_argument("--serial-baudrate", default=115200)
 parser.add_argument("--reconnect-serial", action="store_true", help="handle case when serial device is powered by test device")
+parser.add_argument("--clock", default="monotonic", choices=["monotonic", "monotonic-raw"], help="clock used for all timestamps")
+parser.add_argument("--serial-reader", default="thread", choices=["thread", "serial-asyncio", "fd"], help="read the UART in a separate thread, with serial_asyncio or directly in the event loop")
+parser.add_argument("--estimate-line-ts", action="store_true", help="estimate the arrival time of every line in a block of UART data using the baud rate")
 
 parser.add_argument("--iterations", default=1)
+parser.add_argument("--target-ci", help="stop before --iterations are done if the confidence intervals of all Ids are narrower than +/- this many ms or, with a trailing %%, percent of the average")
+parser.add_argument("--target-ci-ids", help="comma-separated Ids for --target-ci, default: all")
+parser.add_argument("--target-ci-level", default=0.95, help="confidence level for --target-ci")
+parser.add_argument("--min-iterations", default=5, help="minimum number of iterations with --target-ci")
+parser.add_argument("--board", help=argparse.SUPPRESS)
+parser.add_argument("--pool-fd", help=argparse.SUPPRESS)
+parser.add_argument("--pool-power-fd", help=argparse.SUPPRESS)
+parser.add_argument("--pool-results", help=argparse.SUPPRESS)
 parser.add_argument("--min-duration", default=0.1, help="ignore cycles shorter than this")
 parser.add_argument("--cooldown", default="0.5", help="time to wait after a power off until power will be restored")
 
@@ -92,11 +1914,34 @@ parser.add_argument("--show-console-diff", action="store_true")
 parser.add_argument("--color", action="store_true")
 parser.add_argument("--serial-log-file", help="store received serial output in a file")
 parser.add_argument("--pipe", help="create a named pipe that receives a copy of the serial output from the device")
+parser.add_argument("--capture-file", help="store all timestamped lines and power events in a file for --replay")
+parser.add_argument("--capture-compression", default="none", choices=capture_compressions.keys(), help="compress the blocks of the capture file")
+parser.add_argument("--replay", help="analyze a file created with --capture-file instead of measuring")
+parser.add_argument("--replay-iterations", help="only analyze the given iteration (N) or range of iterations (N-M) of the capture, counting from 1 like the \"iteration N done\" output")
+parser.add_argument("--agent", help="stream all events to the collector at HOST:PORT or unix:PATH")
+parser.add_argument("--agent-name", help="name of this agent at the collector, default: hostname")
+parser.add_argument("--agent-lines", action="store_true", help="also stream the received lines to the collector")
+parser.add_argument("--collector", help="collect and merge the events of agents that connect to HOST:PORT or unix:PATH")
 
 parser.add_argument("--ref-file", help="provide a reference file with previously measured values")
 parser.add_argument("--show-reference", action="store_true", help="also show values from reference file")
+parser.add_argument("--gate", action="store_true", help="exit with code 1 if an Id is significantly slower than in the reference file")
+parser.add_argument("--gate-alpha", default=0.05, help="significance level of the regression test")
+parser.add_argument("--gate-threshold", default="0", help="ignore regressions up to this many seconds or, with a trailing %%, percent of the reference value. Can be set per Id with max_regression")
+parser.add_argument("--gate-min-effect", default="0.001", help="if neither the current nor the reference values vary, ignore regressions up to this many seconds or, with a trailing %%, percent of the reference value (default: 0.001)")
+parser.add_argument("--histogram", action="store_true", help="show a histogram of the values of every Id")
+parser.add_argument("--histogram-rows", default=10, help="number of rows of every histogram")
+parser.add_argument("--database", help="store the values of every iteration in this SQLite database")
+parser.add_argument("--revision", help="revision of the firmware stored in the database")
+parser.add_argument("--firmware-dir", help="git checkout of the measured firmware, its git describe output is stored as revision in the database")
+parser.add_argument("--firmware-tag", help="tag of the firmware stored in the database")
+parser.add_argument("--db-report", metavar="ID", help="only show the percentiles of the given Id for the last builds in the database")
+parser.add_argument("--db-builds", default=30, help="number of builds shown by --db-report")
 
 parser.add_argument("--default-source", default="serial")
+parser.add_argument("--event-queue-size", default=65536, help="maximum number of events that wait for processing")
+
+parser.add_argument("--benchmark", choices=benchmarks.keys(), help="only run the given micro-benchmark")
 
 parser.add_argument("-v", "--verbose", action="count", default=0)
 
@@ -123,19 +1968,160 @@ if args.config:
 						)
 					):
 					setattr(args, name.replace("-", "_"), config["general"][name])
+	
+	# a worker of a board pool uses the settings of its [board_*] section
+	if args.board:
+		sect = "board_" + args.board
+		if sect not in config:
+			bsprint("error, no section", sect, "in", args.config, file=sys.stderr)
+			sys.exit(1)
+		
+		for action in parser._actions:
+			for arg in action.option_strings:
+				name = arg.lstrip("-")
+				if name in config[sect]:
+					setattr(args, name.replace("-", "_"), config[sect][name])
+		
+		# every worker writes its own files, e.g., capture-board_a.bin,
+		# unless the section of the board sets them
+		for name in ["capture-file", "pipe", "serial-log-file"]:
+			attr = name.replace("-", "_")
+			if getattr(args, attr) and name not in config[sect]:
+				root, ext = os.path.splitext(getattr(args, attr))
+				setattr(args, attr, "%s-%s%s" % (root, args.board, ext))
+		
+		output_prefix = "[%s] " % args.board
+
+# With [board_*] sections in the config, this process only distributes the
+# iterations among one worker process per board and merges their results.
+if args.config and not args.board:
+	pool_boards = [sect[len("board_"):] for sect in config.sections() if sect.startswith("board_")]
+else:
+	pool_boards = []
+
+# A worker opens the sigrok device of its board on its own. If several boards
+# use the same device, the coordinator opens it instead and sends the
+# transitions of the power channel of every board, i.e., the first channel in
+# sr_channels of its section, to the worker of the board.
+sigrok_boards = {}
+for board in pool_boards:
+	sect = config["board_" + board]
+	
+	options = {}
+	for name in ["sr_driver", "sr_device", "sr_channels"]:
+		options[name] = sect.get(name, getattr(args, name))
+	if not any(options.values()):
+		continue
+	
+	device = (options["sr_driver"] or "fx2lafw", options["sr_device"] or "0")
+	if device not in sigrok_boards:
+		sigrok_boards[device] = []
+	sigrok_boards[device].append(board)
+
+shared_devices = [device for device, boards in sigrok_boards.items() if len(boards) > 1]
+if len(shared_devices) > 1:
+	bsprint("error, only one sigrok device can be shared by several boards", file=sys.stderr)
+	sys.exit(1)
+
+# power channel of every board on the shared sigrok device
+pool_power_channels = {}
+if shared_devices:
+	for board in sigrok_boards[shared_devices[0]]:
+		sect = config["board_" + board]
+		
+		if "sr_channels" not in sect:
+			bsprint("error, board %s shares a sigrok device and requires its own power channel in sr_channels" % board, file=sys.stderr)
+			sys.exit(1)
+		
+		for name in ["sr-trigger", "sr-power-channel", "sr-current-channel"]:
+			if sect.get(name, getattr(args, name.replace("-", "_"))):
+				bsprint("error, %s is not supported for boards sharing a sigrok device" % name, file=sys.stderr)
+				sys.exit(1)
+		
+		channel = sect["sr_channels"].split(',')[0]
+		for other, other_channel in pool_power_channels.items():
+			if other_channel == channel:
+				bsprint("error, boards %s and %s use the same power channel %s" % (other, board, channel), file=sys.stderr)
+				sys.exit(1)
+		pool_power_channels[board] = channel
+	
+	args.sr_driver = sect.get("sr_driver", args.sr_driver)
+	args.sr_device = sect.get("sr_device", args.sr_device)
+	args.sr_channels = ",".join(pool_power_channels.values())
+
+# the timestamp and the new state of a transition of the power channel, the
+# first record contains the initial state
+pool_power_record = struct.Struct("<qB")
+pool_power_socks = { board: socket.socketpair() for board in pool_power_channels }
+
+# this process neither analyzes a capture, coordinates a board pool nor
+# collects the events of agents
+local_measurement = not (args.replay or pool_boards or args.collector)
 
 args.cooldown = float(args.cooldown)
 
+if args.clock != "monotonic":
+	set_clock(args.clock)
+	global_ts_start = clock_ns()
+
+if args.benchmark:
+	benchmarks[args.benchmark]()
+	sys.exit(0)
+
+if args.db_report:
+	if not args.database:
+		bsprint("error, --db-report requires --database", file=sys.stderr)
+		sys.exit(1)
+	
+	# the database contains the Ids of the sections, also accept the names
+	# that are shown in the results
+	mpoint = args.db_report
+	for sect in config.sections():
+		if not sect.startswith("trigger_") and not sect.startswith("interval_"):
+			continue
+		
+		name = sect.split("_", 1)[1]
+		if config[sect].get("name", name.replace("_", " ")) == args.db_report:
+			mpoint = name
+	
+	store = ResultStore(args.database)
+	builds = store.builds(mpoint, int(args.db_builds))
+	store.close()
+	
+	print("%-30s %6s %10s %10s %10s %10s" % ("Build", "n", "avg", "p50", "p90", "p99"))
+	for build, values in builds.items():
+		if not values:
+			continue
+		values.sort()
+		print("%-30s %6d %10.6f %10.6f %10.6f %10.6f" % (
+			build[:30], len(values),
+			sum(values) / len(values),
+			values[len(values) // 2],
+			values[min(len(values) - 1, int(len(values) * 0.9))],
+			values[min(len(values) - 1, int(len(values) * 0.99))],
+			))
+	sys.exit(0)
+
+if args.target_ci and pool_boards:
+	bsprint("error, --target-ci is not supported with a board pool", file=sys.stderr)
+	sys.exit(1)
+
+if args.gate and not args.ref_file:
+	bsprint("error, --gate requires --ref-file", file=sys.stderr)
+	sys.exit(1)
+
 if (
 	(not args.poweron or not args.poweroff)
+	and not args.power_backend
 	and not (args.manual_power or args.sysrq_reboot)
 	and not args.sr_monitor
 	and not args.sr_scan
+	and local_measurement
 	):
 	bsprint("either specify manual-power of sysrq-reboot if poweron or poweroff is missing")
 	sys.exit(1)
 
-if args.pipe:
+if args.pipe and local_measurement:
 	os.mkfifo(args.pipe)
 	named_pipe = open(args.pipe, 'w')
 else:
@@ -163,6 +2149,7 @@ class Timer:
 		self._task.cancel()
 
 available_tasks = {}
+available_power_backends = {}
 for fname in os.listdir("."):
 	r = re_match("^task_([-_0-9a-z]+).py$", fname)
 	if r:
@@ -175,10 +2162,35 @@ for fname in os.listdir("."):
 		task = SourceFileLoader(name, fname).load_module()
 		task.init(globals(), r.group(1))
 		available_tasks[r.group(1)] = { "module": task, "name": r.group(1) }
+	
+	r = re_match("^power_([-_0-9a-z]+).py$", fname)
+	if r:
+		from importlib.machinery import SourceFileLoader
+		backend = SourceFileLoader("power_" + r.group(1), fname).load_module()
+		backend.init(globals(), r.group(1))
+		available_power_backends[r.group(1)] = { "module": backend, "name": r.group(1) }
+
+# A power backend keeps its connection to the power switch open during the
+# whole measurement. Its options are read from the [power_NAME] section.
+if args.power_backend and local_measurement:
+	if args.power_backend not in available_power_backends:
+		bsprint("error, no power backend", args.power_backend, "found", file=sys.stderr)
+		sys.exit(1)
+	
+	power_backend = available_power_backends[args.power_backend].copy()
+	if args.config and "power_" + args.power_backend in config:
+		power_backend.update(config["power_" + args.power_backend])
+else:
+	power_backend = None
 
 class MRun():
 	def __init__(self):
-		self.history = {}
+		# statistics of every mpoint and interval, see RunningStats
+		self.stats = {}
+		# share of every interval in the time until power off
+		self.share_stats = {}
+		# quantiles of every mpoint and interval, see QuantileSketch
+		self.sketches = {}
 		self.mpoints = {}
 		self.mintervals = {}
 		self.tasks = {}
@@ -193,6 +2205,17 @@ class MRun():
 		self.start_task = None
 		self.flush_input = False
 		self.wait_on_poweroff = False
+		self.power_task = None
+		self.power_latency = {}
+		
+		# lines that are received while the power-on command is running
+		self.held_lines = None
+		
+		# logic analyzer channels used by triggers with source=sigrok
+		self.sigrok_channels = set()
+		
+		# energy (J) and duration (s) of every stage and interval, see EnergyMeter
+		self.energy_stats = {}
 		
 		triggers = {}
 		
@@ -219,10 +2242,24 @@ class MRun():
 				name = sect[len("trigger_"):]
 				
 				self.mpoints[name] = { "config": config[sect] }
-				if "trigger" in config[sect]:
+				if config[sect].get("source") == "sigrok":
+					# edges of logic analyzer channels are passed as lines like "D3 rising"
+					channel = config[sect].get("channel")
+					edge = config[sect].get("edge", "rising")
+					if not channel or edge not in ["rising", "falling"]:
+						bsprint("error, section %s requires channel=NAME and edge=rising|falling" % sect, file=sys.stderr)
+						sys.exit(1)
+					
+					self.mpoints[name]["trigger"] = ("%s %s" % (channel, edge)).encode()
+					self.sigrok_channels.add(channel)
+				elif "trigger" in config[sect]:
 					self.mpoints[name]["trigger"] = config[sect]["trigger"].encode()
 				elif "regexp" in config[sect]:
-					self.mpoints[name]["regexp"] = config[sect]["regexp"].encode()
+					try:
+						self.mpoints[name]["regexp"] = re_compile(config[sect]["regexp"].encode())
+					except re_error as exc:
+						bsprint("error, invalid regexp in section %s:" % sect, exc, file=sys.stderr)
+						sys.exit(1)
 				else:
 					self.mpoints[name]["trigger"] = name.encode()
 				
@@ -281,12 +2318,61 @@ class MRun():
 		for mpoint in self.mpoints:
 			if self.max_name_length is None or len(self.mpoints[mpoint]["name"]) > self.max_name_length:
 				self.max_name_length = len(self.mpoints[mpoint]["name"])
+		
+		# compile the triggers and group them by the source of the lines they
+		# are interested in
+		self.triggers = {}
+		sources = {}
+		for mname, mdict in self.mpoints.items():
+			if "trigger" not in mdict and "regexp" not in mdict:
+				continue
+			
+			trig = Trigger(mname, mdict, len(self.triggers), args.default_source)
+			self.triggers[mname] = trig
+			
+			if trig.source not in sources:
+				sources[trig.source] = []
+			sources[trig.source].append(trig)
+		
+		self.trigger_index = {}
+		for source, triggers in sources.items():
+			self.trigger_index[source] = TriggerIndex(triggers)
+		
+		# triggers that have to be re-evaluated if a value gets recorded
+		self.trigger_deps = {}
+		for trig in self.triggers.values():
+			for dep in (trig.before, trig.after):
+				if not dep:
+					continue
+				if dep not in self.trigger_deps:
+					self.trigger_deps[dep] = []
+				self.trigger_deps[dep].append(trig)
+		
+		self.state = IterationState(self.triggers, self.trigger_deps)
+	
+	# the device was powered on or restarted at ts, all values of the
+	# iteration are relative to this time. If the start is not a power event,
+	# source describes the restart for the capture file.
+	def setStart(self, ts, source=None):
+		self.start_ts = ts
+		self.last_ts = ts
+		self.state.record("power_on", 0)
+		
+		if source and args.capture_file:
+			capture_write(ts, "power", source, b"1")
 	
-	def start(self):
+	# start_ts is given if the device was already restarted
+	def start(self, start_ts=None):
 		global iterations
 		
-		for mname in self.mpoints:
-			self.mpoints[mname]["matched"] = False
+		self.state = IterationState(self.triggers, self.trigger_deps)
+		
+		if args.capture_file:
+			capture_write(clock_ns(), "iteration", "", b"%d" % iterations)
+		if agent:
+			agent.send(clock_ns(), AGENT_ITERATION, b"")
+		if start_ts is not None:
+			self.setStart(start_ts, "sysrq" if args.sysrq_reboot else "manual")
 		
 		if args.serial_log_file:
 			global serial_log_fd
@@ -306,30 +2392,34 @@ class MRun():
 		self.power_on()
 		
 		if iterations == 0:
-			if not args.poweron and not args.manual_power and args.sysrq_reboot:
-				# wait until serial connection is established
-				
-				uart_thread.started.acquire()
-				while not uart_thread.ser:
-					uart_thread.started.wait()
-				uart_thread.started.release()
-				
-				send_sysrq_reboot()
-				
-				mrun.powered = True
-				
-				ts = datetime.datetime.now().timestamp()
-				self.start_ts = ts
-				self.last_ts = ts
+			if not args.poweron and not power_backend and not args.manual_power and args.sysrq_reboot:
+				self.start_task = eloop.create_task(self.async_sysrq_start())
+	
+	# restart the device for the first iteration as soon as the serial
+	# connection is established
+	async def async_sysrq_start(self):
+		while not uart_reader.ser:
+			await asyncio.sleep(0.1)
+		
+		await send_sysrq_reboot()
+		
+		self.powered = True
+		self.setStart(clock_ns(), "sysrq")
+	
+	# restart the device for the next iteration
+	async def async_sysrq_restart(self):
+		await send_sysrq_reboot()
+		
+		self.startNewIteration(False, clock_ns())
 	
 	# initiate a new measurement run
-	async def async_start(self, cooldown=False):
+	async def async_start(self, cooldown=False, start_ts=None):
 		if cooldown:
 			await asyncio.sleep(args.cooldown)
 		
-		self.start()
+		self.start(start_ts)
 	
-	def powerChanged(self, state):
+	def powerChanged(self, state, ts=None):
 		global iterations, global_stop
 		
 		# we do not show a message every time as we could get spurious transitions after
@@ -343,23 +2433,26 @@ class MRun():
 			else:
 				bsprint(state)
 		
+		if ts is None:
+			ts = clock_ns()
+		
+		if args.capture_file:
+			capture_write(ts, "power", "sigrok" if sigrok_session else "command", state.encode())
+		if agent:
+			agent.send(ts, AGENT_POWER, state.encode())
+		
 		if state == "1":
-			ts = datetime.datetime.now().timestamp()
-			
-			self.start_ts = ts
-			self.last_ts = ts
+			self.setStart(ts)
+			self.markEnergy("power_on", ts)
 		elif state == "0":
-			ts = datetime.datetime.now().timestamp()
-			
 			if self.start_ts and sigrok_session:
-				if "power_off" not in self.history:
-					self.history["power_off"] = []
-				self.history["power_off"].append(ts - self.start_ts)
+				self.addValue("power_off", (ts - self.start_ts) / NS_PER_SEC, ts)
+				self.markEnergy("power_off", ts)
 			
 			if sigrok_session and self.match_in_iteration:
 				if not self.match_in_iteration:
 					if args.verbose:
-						bsprint("nothing measured, will ignore power cycle (%8.5f)" %(ts - self.start_ts))
+						bsprint("nothing measured, will ignore power cycle (%8.5f)" %((ts - self.start_ts) / NS_PER_SEC))
 					
 					self.start_task = asyncio.run_coroutine_threadsafe(self.async_start(True), eloop)
 				else:
@@ -368,25 +2461,46 @@ class MRun():
 			if args.verbose:
 				bsprint("unexpected state change to", state)
 	
-	def newLines(self, lines, source=None):
-		for ts, line in lines:
-			self.newLine(ts, line, source=source)
+	# handle a batch of events from the event bus
+	def processEvents(self, events):
+		in_block = False
+		flush = False
+		for event in events:
+			if event[0] == EVENT_POWER:
+				self.powerChanged(event[2], event[1])
+				continue
 			
-			if mrun.flush_input:
-				mrun.flush_input = False
-				break
+			if event[0] == EVENT_BLOCK:
+				in_block = event[1]
+				flush = False
+				continue
+			
+			# skip the remaining serial lines of the read block that were
+			# received before the input was flushed
+			if flush and event[3] == "serial":
+				continue
+			
+			self.newLine(event[1], event[2], source=event[3])
+			
+			if self.flush_input:
+				self.flush_input = False
+				flush = in_block
 	
 	# new line received from serial device
 	def newLine(self, ts, line, source=None):
 		global named_pipe
 		
+		if self.held_lines is not None:
+			self.held_lines.append((ts, line, source))
+			return
+		
 		found = False
 		
 		if args.show_console or args.show_console_diff:
 			diff = None
 			if args.show_console_diff:
 				if getattr(self, "last_line_ts", None):
-					diff = ts - self.last_line_ts
+					diff = (ts - self.last_line_ts) / NS_PER_SEC
 				self.last_line_ts = ts
 			
 			#bsprint(bytes(filter(lambda x: x >= 32, line)).decode(), ts=ts)
@@ -413,126 +2527,120 @@ class MRun():
 			
 			serial_log_fd.write(line)
 		
+		if args.capture_file:
+			capture_write(ts, "line", source, line)
+		if agent and args.agent_lines:
+			agent.send(ts, AGENT_LINE, source.encode() + b"\x00" + line)
+		
 		if self.start_ts is None:
 			return
 		
 		if not self.measuring:
 			return
 		
-		trig_dicts = self.mpoints
+		index = self.trigger_index.get(source)
+		if index is None:
+			return
 		
-		for mname, mdict in trig_dicts.items():
-			if "config" in mdict:
-				if "source" not in mdict["config"] and source != args.default_source:
-					continue
-				if "source" in mdict["config"] and mdict["config"]["source"] != source:
-					continue
-			
-			if (
-				"trigger" in mdict and line.find(mdict["trigger"]) > -1
-				or "regexp" in mdict and re_match(mdict["regexp"], line)
-				):
-				before = trig_dicts[mname]["config"].get("before", "")
-				if before and before in self.history and len(self.history[before]) >= iterations+1:
-					continue
-				
-				after = trig_dicts[mname]["config"].get("after", "")
-				if after and (after not in self.history or len(self.history[after]) < iterations+1):
-					continue
-				
-				found = True
-				pretty_name = trig_dicts[mname].get("name")
-				name = mname
-				break
+		state = self.state
+		# skip triggers that cannot fire in the current stage due to before/after
+		for trig in index.search(line, state.blocked):
+			found = True
+			break
 		
 		if found:
 			self.match_in_iteration = True
 			
-			if name not in self.history:
-				self.history[name] = []
+			name = trig.name
+			pretty_name = trig.pretty_name
+			matched_trig = trig
+			
+			if name not in self.stats:
+				self.stats[name] = RunningStats()
 			
 			# have we seen this trigger already in this run?
-			if len(self.history[name]) > iterations:
-				if int(trig_dicts[mname]["config"].get("multi_trigger", "0")):
+			if name in state.values:
+				if trig.multi_trigger:
 					i = 2
 					while True:
 						new_name = name+"_"+str(i)
-						if new_name not in self.history:
-							self.history[new_name] = []
-						if len(self.history[new_name]) == iterations:
-							trig_dicts[new_name] = trig_dicts[name].copy()
-							trig_dicts[new_name]["name"] += " "+str(i)
+						if new_name not in self.stats:
+							self.stats[new_name] = RunningStats()
+						if new_name not in state.values:
+							self.mpoints[new_name] = self.mpoints[name].copy()
+							self.mpoints[new_name]["name"] += " "+str(i)
+							if new_name not in self.triggers:
+								self.triggers[new_name] = trig.copy(new_name, self.mpoints[new_name]["name"])
+								state.outstanding += 1
 							name = new_name
-							pretty_name = trig_dicts[new_name]["name"]
+							pretty_name = self.mpoints[new_name]["name"]
+							matched_trig = self.triggers[new_name]
 							break
 						i += 1
-				elif int(trig_dicts[mname]["config"].get("ignore_multiple_trigger", "0")):
+				elif trig.ignore_multiple_trigger:
 					return
 				else:
 					bsprint(f"received \"{name}\" multiple times, ignoring (set multi_trigger=1 to accept multiple values)", file=sys.stderr)
 					return
 			
-			print(color("%*s %10.6f  (delta %10.6f)" % (self.max_name_length, pretty_name, ts - self.start_ts, ts - self.last_ts), "blue"))
+			print(output_prefix + color("%*s %10.6f  (delta %10.6f)" % (self.max_name_length, pretty_name, (ts - self.start_ts) / NS_PER_SEC, (ts - self.last_ts) / NS_PER_SEC), "blue"))
 			
 			self.last_ts = ts
-			self.history[name].append(ts - self.start_ts)
+			self.addValue(name, (ts - self.start_ts) / NS_PER_SEC, ts)
+			self.markEnergy(name, ts)
 			
-			if "intervals" in trig_dicts[mname]:
-				for inter_name in trig_dicts[mname]["intervals"]:
-					inter = self.mintervals[inter_name]
-					
-					if inter_name not in self.history:
-						self.history[inter_name] = []
-					
-					from_name = self.mintervals[inter_name]["from"]
-					to_name = self.mintervals[inter_name]["to"]
+			for inter_name in trig.intervals:
+				if inter_name not in self.stats:
+					self.stats[inter_name] = RunningStats()
+				
+				from_name = self.mintervals[inter_name]["from"]
+				to_name = self.mintervals[inter_name]["to"]
+				
+				if from_name in state.values and to_name in state.values:
+					self.addValue(inter_name, state.values[to_name] - state.values[from_name], ts)
 					
-					if from_name in self.history and to_name in self.history:
-						if len(self.history[from_name]) == iterations+1 and len(self.history[to_name]) == iterations+1:
-							self.history[inter_name].append(self.history[to_name][-1] - self.history[from_name][-1])
-							
-							print("%*s %10s  (delta %10.6f)" % (self.max_name_length, self.mintervals[inter_name]["name"], "", self.history[inter_name][-1]))
+					print(output_prefix + "%*s %10s  (delta %10.6f)" % (self.max_name_length, self.mintervals[inter_name]["name"], "", state.values[inter_name]))
 			
-			trig_dicts[name]["matched"] = True
+			state.match(matched_trig)
 			
-			if "start_task" in trig_dicts[mname]["config"]:
-				tname = trig_dicts[mname]["config"]["start_task"]
+			# tasks are not started again while analyzing a capture
+			if trig.start_task and not args.replay:
+				tname = trig.start_task
 				if tname in self.tasks:
 					if args.verbose:
 						bsprint("starting task", tname)
-					self.tasks[tname]["module"].start(mname, self.tasks[tname])
+					self.tasks[tname]["module"].start(trig.name, self.tasks[tname])
 					if self.tasks[tname] not in self.active_tasks:
 						self.active_tasks.append(self.tasks[tname])
-			if "stop_task" in trig_dicts[mname]["config"]:
-				tname = trig_dicts[mname]["config"]["stop_task"]
+			if trig.stop_task and not args.replay:
+				tname = trig.stop_task
 				if tname in self.tasks:
 					if args.verbose:
 						bsprint("stopping task", tname)
-					self.tasks[tname]["module"].stop(mname, self.tasks[tname])
+					self.tasks[tname]["module"].stop(trig.name, self.tasks[tname])
 					if self.tasks[tname] in self.active_tasks:
 						self.active_tasks.remove(self.tasks[tname])
 			
 			# check if all triggers were matchewd during this run or if a "powerOff"
 			# trigger matched
-			stop = True
-			for mname in trig_dicts:
-				if "trigger" not in trig_dicts[mname] and "regexp" not in trig_dicts[mname]:
-					continue
-				if not trig_dicts[mname]["matched"]:
-					stop = False
-				elif trig_dicts[mname]["config"].get("powerCycle", "0") == "1":
-					delay_poweroff = int(trig_dicts[mname]["config"].get("powerCycleAfter", "0"))
-					stop = True
-					break
-			
-			if stop:
+			if state.done():
+				if state.power_cycle:
+					delay_poweroff = state.power_cycle.power_cycle_after
+				else:
+					delay_poweroff = 0
+				
 				if args.verbose:
 					bsprint("will stop measurement")
 				
 				for task in self.active_tasks:
 					task["module"].stop(task["task_name"], task)
 				
-				if args.poweroff and not args.manual_power:
+				if args.replay:
+					# the next iteration starts with the next recorded iteration.
+					# Show the number of the recording for --replay-iterations.
+					bsprint("iteration", self.replay_number + 1, "done")
+					self.measuring = False
+				elif (args.poweroff or power_backend) and not args.manual_power:
 					if delay_poweroff > 0:
 						if self.delayed_poweroff_task is None:
 							if args.verbose:
@@ -549,34 +2657,46 @@ class MRun():
 					bsprint("iteration", iterations+1, "done")
 					
 					self.measuring = False
-					
-					if iterations >= int(args.iterations)-1:
-						global_stop = True
-						eloop.call_soon_threadsafe(eloop.stop)
-						return
-					
-					if args.sysrq_reboot:
-						send_sysrq_reboot()
-					else:
-						bsprint("you can turn off or reset the device now", file=sys.stderr)
-					
-					ts = datetime.datetime.now().timestamp()
-					self.start_ts = ts
-					self.last_ts = ts
-					
-					self.startNewIteration(not args.sysrq_reboot)
+					self.start_task = eloop.create_task(self.async_restart_after_iteration())
 				else:
 					bsprint("error, no method specified to restart target", file=sys.stderr)
 					sys.exit(1)
 	
+	async def async_restart_after_iteration(self):
+		global global_stop
+		
+		if not await more_iterations():
+			global_stop = True
+			eloop.stop()
+			return
+		
+		if args.sysrq_reboot:
+			await self.async_sysrq_restart()
+		else:
+			bsprint("you can turn off or reset the device now", file=sys.stderr)
+			self.startNewIteration(True, clock_ns())
+	
+	# more_iterations() could wait for the coordinator of a board pool, hence
+	# the power-off is done in a task
 	def power_off_after_iteration(self):
 		bsprint("iteration", iterations+1, "done")
 		
-		if iterations >= int(args.iterations)-1:
-			self.power_off(initial=True)
-			
+		self.measuring = False
+		self.wait_on_poweroff = True
+		self.start_task = eloop.create_task(self.async_power_off_after_iteration())
+	
+	async def async_power_off_after_iteration(self):
+		global global_stop
+		
+		if not await more_iterations():
 			global_stop = True
-			eloop.call_soon_threadsafe(eloop.stop)
+			
+			# stop after the device was powered off
+			task = self.power_off(initial=True)
+			if task:
+				task.add_done_callback(lambda task: eloop.stop())
+			else:
+				eloop.call_soon_threadsafe(eloop.stop)
 			return
 		else:
 			self.power_off()
@@ -585,6 +2705,60 @@ class MRun():
 		self.power_off_after_iteration()
 		self.delayed_poweroff_task = None
 	
+	# run a power command or ask the power backend without blocking the event
+	# loop and return the timestamps when the command was started and when it
+	# finished
+	async def power_command(self, name, cmd):
+		if sigrok_arm:
+			await sigrok_arm()
+		
+		start_ts = clock_ns()
+		if power_backend:
+			if name == "poweron":
+				switch = power_backend["module"].on(power_backend)
+			else:
+				switch = power_backend["module"].off(power_backend)
+			
+			try:
+				start_ts, end_ts = await asyncio.wait_for(switch, float(args.power_timeout))
+			except asyncio.TimeoutError:
+				bsprint("error, %s of backend %s did not finish within %s seconds" % (name, power_backend["name"], args.power_timeout), file=sys.stderr)
+				end_ts = clock_ns()
+		else:
+			# the command runs in its own process group, so a timeout also
+			# kills the programs that the shell started
+			proc = await asyncio.create_subprocess_shell(cmd, start_new_session=True)
+			try:
+				await asyncio.wait_for(proc.wait(), float(args.power_timeout))
+			except asyncio.TimeoutError:
+				bsprint("error, %s command did not finish within %s seconds" % (name, args.power_timeout), file=sys.stderr)
+				try:
+					os.killpg(proc.pid, signal.SIGKILL)
+				except ProcessLookupError:
+					pass
+				await proc.wait()
+			end_ts = clock_ns()
+			
+			if proc.returncode and args.verbose:
+				bsprint("%s command returned %d" % (name, proc.returncode), file=sys.stderr)
+		
+		if name not in self.power_latency:
+			self.power_latency[name] = []
+		self.power_latency[name].append((end_ts - start_ts) / NS_PER_SEC)
+		
+		return start_ts, end_ts
+	
+	async def async_power_off(self, initial=False):
+		await self.power_command("poweroff", args.poweroff)
+		
+		if not sigrok_session:
+			self.powered = False
+		
+		if not sigrok_session and not initial:
+			self.powerChanged("0")
+			self.startNewIteration()
+	
+	# returns the task that runs the power-off command, if any
 	def power_off(self, initial=False):
 		self.measuring = False
 		self.wait_on_poweroff = True
@@ -593,8 +2767,9 @@ class MRun():
 			if args.verbose and not args.manual_power:
 				bsprint("powering off")
 			
-			if args.poweroff and not args.manual_power:
-				os.system(args.poweroff)
+			if (args.poweroff or power_backend) and not args.manual_power:
+				self.power_task = eloop.create_task(self.async_power_off(initial))
+				return self.power_task
 			
 			if not sigrok_session:
 				self.powered = False
@@ -602,12 +2777,34 @@ class MRun():
 			if not sigrok_session and not initial:
 				self.powerChanged("0")
 				self.startNewIteration()
+		
+		return None
+	
+	async def async_power_on(self):
+		# without sigrok, the received lines are processed after we know
+		# when the device was powered on
+		if not sigrok_session:
+			self.held_lines = []
+		
+		start_ts, end_ts = await self.power_command("poweron", args.poweron)
+		
+		if not sigrok_session:
+			self.powered = True
+			if args.power_on_edge == "start":
+				self.powerChanged("1", start_ts)
+			else:
+				self.powerChanged("1", end_ts)
+			
+			held_lines = self.held_lines
+			self.held_lines = None
+			for ts, line, source in held_lines:
+				self.newLine(ts, line, source=source)
 	
 	def power_on(self):
 		self.measuring = True
 		
 		if not self.powered:
-			if args.poweron and not args.manual_power:
+			if (args.poweron or power_backend) and not args.manual_power:
 				if args.verbose:
 					bsprint("powering on")
 			elif args.manual_power:
@@ -618,15 +2815,105 @@ class MRun():
 			elif args.sysrq_reboot:
 				bsprint("you can turn on the device now", file=sys.stderr)
 			
-			if args.poweron and not args.manual_power:
-				self.powering_on_ts = datetime.datetime.now().timestamp()
-				os.system(args.poweron)
-			
-			if not sigrok_session:
+			if (args.poweron or power_backend) and not args.manual_power:
+				self.power_task = eloop.create_task(self.async_power_on())
+			elif not sigrok_session:
 				self.powered = True
 				self.powerChanged("1")
 	
-	def startNewIteration(self, cooldown=True):
+	# store a measured value of the current iteration, ts is the time of the
+	# mpoint that completed it
+	def addValue(self, name, value, ts):
+		if name not in self.stats:
+			self.stats[name] = RunningStats()
+		self.stats[name].add(value)
+		if name not in self.sketches:
+			self.sketches[name] = QuantileSketch()
+		self.sketches[name].add(value)
+		if result_store:
+			result_store.add(store_run, iterations, name, value, wall_time(ts))
+		self.state.record(name, value)
+		
+		if name == "power_off" and value > 0:
+			for inter_name in self.mintervals:
+				if inter_name in self.state.values:
+					if inter_name not in self.share_stats:
+						self.share_stats[inter_name] = RunningStats()
+					self.share_stats[inter_name].add(self.state.values[inter_name] / value * 100)
+		
+		if agent:
+			agent.sendValue(name, value, ts)
+	
+	# request the energy that was consumed until a mpoint
+	def markEnergy(self, name, ts):
+		if not energy_meter:
+			return
+		
+		state = self.state
+		state.energy_marks.append((name, ts))
+		energy_meter.lookup((state, name), ts)
+	
+	# Called when the energy at a mpoint is known. Calculates the energy of
+	# the stage that ends with this mpoint (or the next mpoint) and of all
+	# intervals whose start and end are known now. The values are added to
+	# energy_stats.
+	def energyResolved(self, key, joules):
+		state, name = key
+		state.energy[name] = joules
+		
+		for i in range(1, len(state.energy_marks)):
+			prev_name, prev_ts = state.energy_marks[i-1]
+			cur_name, cur_ts = state.energy_marks[i]
+			if cur_name in state.energy_done:
+				continue
+			if prev_name not in state.energy or cur_name not in state.energy:
+				continue
+			
+			state.energy_done.add(cur_name)
+			self.addEnergy(cur_name, state.energy[cur_name] - state.energy[prev_name], (cur_ts - prev_ts) / NS_PER_SEC)
+		
+		marks = dict(state.energy_marks)
+		for inter_name in self.mintervals:
+			from_name = self.mintervals[inter_name]["from"]
+			to_name = self.mintervals[inter_name]["to"]
+			if inter_name in state.energy_done:
+				continue
+			if from_name not in state.energy or to_name not in state.energy:
+				continue
+			
+			state.energy_done.add(inter_name)
+			self.addEnergy(inter_name, state.energy[to_name] - state.energy[from_name], (marks[to_name] - marks[from_name]) / NS_PER_SEC)
+	
+	def addEnergy(self, name, joules, duration):
+		if name not in self.energy_stats:
+			self.energy_stats[name] = (RunningStats(), RunningStats())
+		self.energy_stats[name][0].add(joules)
+		self.energy_stats[name][1].add(duration)
+		
+		if args.verbose:
+			bsprint("energy %s: %.6f J" % (name, joules))
+	
+	# a recorded iteration starts while analyzing a capture
+	def replayIteration(self, number):
+		self.replay_number = number
+		self.state = IterationState(self.triggers, self.trigger_deps)
+		
+		if agent:
+			agent.send(clock_ns(), AGENT_ITERATION, b"")
+		self.match_in_iteration = False
+		self.measuring = True
+		
+		# wait for the recorded power on event
+		self.start_ts = None
+	
+	# a recorded power event while analyzing a capture
+	def replayPower(self, ts, state, source):
+		if state == "1":
+			self.setStart(ts)
+		elif state == "0" and source == "sigrok" and self.start_ts:
+			self.addValue("power_off", (ts - self.start_ts) / NS_PER_SEC, ts)
+	
+	def startNewIteration(self, cooldown=True, start_ts=None):
 		global iterations
 		
 		iterations += 1
@@ -636,9 +2923,9 @@ class MRun():
 		self.match_in_iteration = False
 		
 		if cooldown:
-			self.start_task = asyncio.run_coroutine_threadsafe(self.async_start(True), eloop)
+			self.start_task = asyncio.run_coroutine_threadsafe(self.async_start(True, start_ts), eloop)
 		else:
-			self.start()
+			self.start(start_ts)
 
 mrun = MRun()
 mainlock = threading.Lock()
@@ -646,24 +2933,151 @@ mainlock = threading.Lock()
 iterations = 0
 startup_counter = 0
 serial_log_fd = None
+capture_writer = None
+
+if args.pool_fd:
+	pool_sock = socket.socket(fileno=int(args.pool_fd))
+	pool_sock.setblocking(False)
+else:
+	pool_sock = None
+
+if args.agent:
+	if args.agent_name:
+		agent_name = args.agent_name
+	else:
+		agent_name = socket.gethostname()
+		if args.board:
+			agent_name += "/" + args.board
+	
+	agent = AgentConnection(args.agent, agent_name, config_hash(), firmware_revision(), args.firmware_tag)
+else:
+	agent = None
+
+# the workers of a board pool store their values themselves
+if args.database and not pool_boards:
+	result_store = ResultStore(args.database)
+	if args.collector:
+		# every agent gets its own run
+		store_run = None
+	else:
+		store_run = result_store.startRun(args.board, config_hash(), firmware_revision(), args.firmware_tag)
+else:
+	result_store = None
+
+# --target-ci is a number of milliseconds with an optional "ms" or a
+# percentage with a trailing %
+target_ci_limit = None
+target_ci_percent = None
+target_ci_ids = None
+if args.target_ci:
+	r = re_fullmatch(r"\s*([0-9]+(?:\.[0-9]*)?|\.[0-9]+)\s*(ms|%)?\s*", args.target_ci)
+	if not r or float(r.group(1)) <= 0:
+		bsprint("error, invalid --target-ci \"%s\", expected e.g. 5, 5ms or 1%%" % args.target_ci, file=sys.stderr)
+		sys.exit(1)
+	
+	if r.group(2) == "%":
+		target_ci_percent = float(r.group(1))
+	else:
+		target_ci_limit = float(r.group(1)) / 1000
+	
+	# --iterations is the maximum with --target-ci, its default of 1 would
+	# stop before --min-iterations are done
+	if int(args.iterations) < int(args.min_iterations):
+		bsprint("error, --target-ci requires --iterations (%s) of at least --min-iterations (%s)" % (args.iterations, args.min_iterations), file=sys.stderr)
+		sys.exit(1)
+	
+	# an unknown Id would never reach the target and silently disable the check
+	if args.target_ci_ids:
+		target_ci_ids = [name.strip() for name in args.target_ci_ids.split(",")]
+		for name in target_ci_ids:
+			if name not in mrun.mpoints and name not in mrun.mintervals:
+				bsprint("error, unknown Id \"%s\" in --target-ci-ids, known Ids: %s" % (name, ", ".join(list(mrun.mpoints) + list(mrun.mintervals))), file=sys.stderr)
+				sys.exit(1)
+
+# check if the confidence intervals of the mean of all selected Ids are
+# narrower than the --target-ci
+def confidence_reached():
+	level = float(args.target_ci_level)
+	percent = target_ci_percent
+	limit = target_ci_limit
+	
+	if target_ci_ids:
+		names = target_ci_ids
+	else:
+		# intervals that never completed have no values and are skipped
+		names = [name for name in mrun.stats if name not in ["power_on", "power_off"] and mrun.stats[name].n > 0]
+	if not names:
+		return False
+	
+	reached = True
+	for name in names:
+		stats = mrun.stats.get(name)
+		if stats is None or stats.n < 2:
+			return False
+		
+		half_width = t_quantile((1 + level) / 2, stats.n - 1) * stats.dev() / stats.n ** 0.5
+		if percent is not None:
+			limit = abs(stats.mean) * percent / 100
+		
+		if args.verbose:
+			bsprint("%s: confidence interval +/- %.6f (target %.6f)" % (name, half_width, limit))
+		
+		if half_width > limit:
+			reached = False
+	
+	return reached
+
+# check if another iteration shall be started after the current one. Workers
+# of a board pool ask the coordinator as the iterations are shared among all
+# boards.
+async def more_iterations():
+	if pool_sock:
+		await eloop.sock_sendall(pool_sock, b"?")
+		return await eloop.sock_recv(pool_sock, 1) == b"1"
+	
+	if args.target_ci and iterations + 1 >= int(args.min_iterations) and confidence_reached():
+		bsprint("confidence intervals reached the target after %d iterations" % (iterations + 1))
+		return False
+	
+	return iterations < int(args.iterations) - 1
 
 eloop = asyncio.new_event_loop()
 asyncio.set_event_loop(eloop)
 
+event_bus = EventBus(eloop, mrun.processEvents, int(args.event_queue_size))
+
+if agent:
+	eloop.call_soon(agent.flush_periodically, eloop)
+
 def ask_exit(signame):
 	bsprint("got signal %s: exit" % signame)
 	global_stop = True
 	eloop.stop()
 
+# print the current statistics without interrupting the measurement
+def print_stats():
+	bsprint("current statistics:")
+	for name, stats in mrun.stats.items():
+		if stats.n == 0:
+			continue
+		if name in mrun.mpoints:
+			label = mrun.mpoints[name]["name"]
+		elif name in mrun.mintervals:
+			label = mrun.mintervals[name]["name"]
+		else:
+			label = name
+		bsprint("%*s %10.6f %10.6f %10.6f %10.6f %4d" % (mrun.max_name_length, label, stats.mean, stats.dev(), stats.min, stats.max, stats.n))
+
 if not args.sr_monitor:
 	for signame in ('SIGINT', 'SIGTERM'):
 		eloop.add_signal_handler(getattr(signal, signame),
 								functools.partial(ask_exit, signame))
+	eloop.add_signal_handler(signal.SIGUSR1, print_stats)
 
 ##############
 # setup sigrok
 
-if args.sr_scan or args.sr_driver or args.sr_device or args.sr_channels:
+if (args.sr_scan or args.sr_driver or args.sr_device or args.sr_channels) and (local_measurement or pool_power_channels) and not args.pool_power_fd:
 	import sigrok.core as sr
 	from sigrok.core.classes import *
 
@@ -715,39 +3129,196 @@ if args.sr_scan or args.sr_driver or args.sr_device or args.sr_channels:
 		sigrok_device.config_set(ConfigKey.SAMPLERATE, int(args.sr_samplerate))
 	elif args.verbose:
 		bsprint("Sample rate: ", sigrok_device.config_get(ConfigKey.SAMPLERATE))
+	
+	# timestamps of power edges are calculated from the index of the sample
+	try:
+		samplerate = int(sigrok_device.config_get(ConfigKey.SAMPLERATE))
+	except Exception:
+		samplerate = int(args.sr_samplerate or 0)
+	
+	if samplerate:
+		sample_clock = SampleClock(samplerate, float(args.sr_resync) * NS_PER_SEC)
+	elif args.sr_trigger:
+		bsprint("error, --sr-trigger requires a known sample rate, please set sr_samplerate", file=sys.stderr)
+		sys.exit(1)
+	else:
+		bsprint("unknown sample rate, will use the arrival time of sigrok packets", file=sys.stderr)
+		sample_clock = None
+	
+	# analog channel to calculate the energy of every boot stage
+	if args.sr_power_channel or args.sr_current_channel:
+		if numpy is None:
+			bsprint("error, energy measurement requires numpy", file=sys.stderr)
+			sys.exit(1)
+		if args.sr_trigger:
+			bsprint("error, energy measurement requires continuous sampling, please remove --sr-trigger", file=sys.stderr)
+			sys.exit(1)
+		
+		if args.sr_power_channel:
+			energy_channel = args.sr_power_channel
+			energy_scale = 1.0
+		elif args.supply_voltage:
+			energy_channel = args.sr_current_channel
+			energy_scale = float(args.supply_voltage)
+		else:
+			bsprint("error, --sr-current-channel requires --supply-voltage", file=sys.stderr)
+			sys.exit(1)
+		
+		energy_meter = EnergyMeter(lambda key, joules: eloop.call_soon_threadsafe(mrun.energyResolved, key, joules))
+	else:
+		energy_meter = None
+	
+	if args.sr_idle_samplerate:
+		idle_samplerate = int(args.sr_idle_samplerate)
+		if not args.sr_trigger:
+			bsprint("error, --sr-idle-samplerate requires --sr-trigger", file=sys.stderr)
+			sys.exit(1)
+		if not 0 < idle_samplerate < samplerate:
+			bsprint("error, --sr-idle-samplerate has to be lower than the sample rate (%d)" % samplerate, file=sys.stderr)
+			sys.exit(1)
+	else:
+		idle_samplerate = None
+	
+	if pool_power_channels and mrun.sigrok_channels:
+		bsprint("error, triggers with source=sigrok are not supported for boards sharing a sigrok device", file=sys.stderr)
+		sys.exit(1)
+	
+	if args.sr_trigger:
+		# sigrok would only see the GPIOs of triggers within the window after
+		# every power transition
+		if mrun.sigrok_channels:
+			bsprint("error, triggers with source=sigrok require continuous sampling, please remove --sr-trigger", file=sys.stderr)
+			sys.exit(1)
+		
+		# every acquisition ends after the window and contains a few samples
+		# before the transition
+		trigger_limit = max(1, int(float(args.sr_trigger_window) * samplerate))
+		sigrok_device.config_set(ConfigKey.LIMIT_SAMPLES, trigger_limit)
+		try:
+			sigrok_device.config_set(ConfigKey.CAPTURE_RATIO, 10)
+		except Exception:
+			if args.verbose:
+				bsprint("sigrok device does not support a capture ratio")
 
 	if args.sr_channels:
-		enabled_channels = set(args.sr_channels.split(','))
+		enabled_channels = set(args.sr_channels.split(',')) | mrun.sigrok_channels
+		if energy_meter:
+			enabled_channels.add(energy_channel)
 		for channel in sigrok_device.channels:
 			channel.enabled = (channel.name in enabled_channels)
-
-	#output_format = 'bits'
-	output_format = 'csv'
-	sigrok_output = context.output_formats[output_format].create_output(sigrok_device)
+	
+	channel_indexes = { channel.name: channel.index for channel in sigrok_device.channels if channel.enabled }
+	for name in mrun.sigrok_channels:
+		if name not in channel_indexes:
+			bsprint("error, sigrok device has no channel", name, file=sys.stderr)
+			sys.exit(1)
+	
+	# the power state is read from the first channel in sr_channels, the
+	# other channels are only observed by triggers
+	if args.sr_channels:
+		power_channel = channel_indexes[args.sr_channels.split(',')[0]]
+	else:
+		power_channel = [channel.index for channel in sigrok_device.channels if channel.enabled][0]
+	trigger_channels = { channel_indexes[name]: name.encode() for name in mrun.sigrok_channels }
+	trigger_states = { index: None for index in trigger_channels }
+	
+	# the coordinator of a board pool sends the transitions of the power
+	# channel of every board to its worker
+	pool_channels = {}
+	for board, name in pool_power_channels.items():
+		if name not in channel_indexes:
+			bsprint("error, sigrok device has no channel", name, file=sys.stderr)
+			sys.exit(1)
+		pool_channels[channel_indexes[name]] = pool_power_socks[board][0]
+	pool_states = { index: None for index in pool_channels }
+	
+	def pool_send(sock, ts, state):
+		try:
+			sock.sendall(pool_power_record.pack(ts, state))
+		except OSError:
+			# the worker already stopped
+			pass
+	
+	def pool_datafeed_in(payload, n_samples, ts):
+		if sample_clock:
+			sample_clock.packet(n_samples, ts)
+			first_sample = sample_clock.samples - n_samples
+		
+		for index, sock in pool_channels.items():
+			if pool_states[index] is None:
+				edges, pool_states[index] = logic_edges(payload.data, payload.unit_size, index, None)
+				if pool_states[index] is not None:
+					pool_send(sock, ts, pool_states[index])
+				continue
+			
+			edges, pool_states[index] = logic_edges(payload.data, payload.unit_size, index, pool_states[index])
+			for sample, state in edges:
+				if sample_clock:
+					pool_send(sock, sample_clock.ts(first_sample + sample), state)
+				else:
+					pool_send(sock, ts, state)
+	
+	if args.sr_monitor:
+		#output_format = 'bits'
+		output_format = 'csv'
+		sigrok_output = context.output_formats[output_format].create_output(sigrok_device)
 
 	lastline = None
+	power_state = None
+	energy_samples = 0
 	def datafeed_in(sigrok_device, packet):
-		global lastline
+		global lastline, power_state, energy_samples
 		
-		lines = sigrok_output.receive(packet)
+		ts = clock_ns()
 		
 		if args.sr_monitor:
+			lines = sigrok_output.receive(packet)
 			for line in lines.split("\n"):
 				if line and lastline and lastline != line:
 					print(line)
 				lastline = line
 			return
 		
-		if lastline is None:
-			for line in lines.split("\n"):
-				if not line:
+		if packet.type == PacketType.ANALOG and energy_meter:
+			payload = packet.payload
+			for row, channel in enumerate(payload.channels):
+				if channel.name != energy_channel:
 					continue
-				if line == "1":
-					mrun.powered = True
-				elif line == "0":
-					mrun.powered = False
 				
-				lastline = line
+				values = payload.data[row] * energy_scale
+				
+				# analog samples use the same sample clock as the logic samples,
+				# without a sample rate (e.g., multimeters) the arrival time is used
+				if sample_clock:
+					energy_samples += len(values)
+					if sample_clock.anchor_ts is not None:
+						energy_meter.add(values, sample_clock.ts(energy_samples - 1), sample_clock.period)
+				else:
+					energy_meter.add(values, ts)
+			return
+		
+		if packet.type != PacketType.LOGIC:
+			return
+		
+		payload = packet.payload
+		n_samples = len(payload.data) // payload.unit_size
+		
+		if pool_channels:
+			pool_datafeed_in(payload, n_samples, ts)
+			return
+		
+		if power_state is None:
+			edges, power_state = logic_edges(payload.data, payload.unit_size, power_channel, None)
+			if power_state is None:
+				return
+			
+			mrun.powered = (power_state == 1)
+			
+			for index in trigger_channels:
+				edges, trigger_states[index] = logic_edges(payload.data, payload.unit_size, index, None)
+			
+			if sample_clock:
+				sample_clock.packet(n_samples, ts)
 			
 			with mainlock:
 				global startup_counter, eloop
@@ -761,22 +3332,33 @@ if args.sr_scan or args.sr_driver or args.sr_device or args.sr_channels:
 			
 			return
 		
-		for line in lines.split("\n"):
-			if not line:
-				continue
-			if lastline is None or lastline == "logic":
-				if line == "1":
-					mrun.powered = True
-				elif line == "0":
-					mrun.powered = False
-			elif lastline != line:
-				if line == "1":
-					mrun.powered = True
-				elif line == "0":
-					mrun.powered = False
-				mrun.powerChanged(line)
-			
-			lastline = line
+		# only the transitions of the power channel and the channels of triggers
+		# are passed to MRun in the order of their samples
+		edges, power_state = logic_edges(payload.data, payload.unit_size, power_channel, power_state)
+		events = [(index, None, state) for index, state in edges]
+		for channel, name in trigger_channels.items():
+			edges, trigger_states[channel] = logic_edges(payload.data, payload.unit_size, channel, trigger_states[channel])
+			events += [(index, name, state) for index, state in edges]
+		if trigger_channels:
+			events.sort(key=operator.itemgetter(0))
+		
+		# the clock is updated first as it could be anchored by this packet
+		if sample_clock:
+			sample_clock.packet(n_samples, ts)
+			first_sample = sample_clock.samples - n_samples
+		
+		for index, name, state in events:
+			if sample_clock:
+				edge_ts = sample_clock.ts(first_sample + index)
+			else:
+				edge_ts = ts
+			
+			if name is None:
+				# queued first, see drain_energy()
+				event_bus.push_power(edge_ts, str(state))
+				mrun.powered = (state == 1)
+			else:
+				event_bus.push_line(edge_ts, name + (b" rising" if state else b" falling"), "sigrok")
 
 	sigrok_session = None
 
@@ -789,12 +3371,95 @@ if args.sr_scan or args.sr_driver or args.sr_device or args.sr_channels:
 		sigrok_session = context.create_session()
 
 		sigrok_session.add_device(sigrok_device)
+		
+		if args.sr_trigger:
+			triggered_acquisitions()
+			return
 
 		sigrok_session.start()
 		
 		sigrok_session.add_datafeed_callback(datafeed_in)
 		
 		sigrok_session.run()
+	
+	# Instead of streaming all samples, start a new acquisition that waits for
+	# the next transition of the power channel after every power on and off.
+	# The host only receives the samples in the window around the transition.
+	# The first acquisition is not triggered and only reads the initial state.
+	#
+	# Some devices, e.g., fx2lafw, evaluate the trigger in software and still
+	# stream all samples to the host while waiting. With
+	# --sr-idle-samplerate, the acquisition runs at the low rate instead and
+	# sigrok_arm() switches to a triggered acquisition at the full rate before
+	# every power command. Power changes without a command, e.g., manual ones,
+	# are only detected with the resolution of the low rate.
+	#
+	# Note that the sample clock is anchored again for every acquisition,
+	# hence the timestamps of the power transitions contain the USB latency
+	# jitter of the first packet of every acquisition, reduced by the average
+	# correction of SampleClock.settle(). For the accuracy of one sample,
+	# sample continuously without --sr-trigger.
+	sr_edge_expected = threading.Event()
+	sr_armed = threading.Event()
+	
+	def triggered_acquisitions():
+		power_ch = [channel for channel in sigrok_device.channels if channel.index == power_channel][0]
+		
+		sigrok_session.add_datafeed_callback(datafeed_in)
+		
+		while not global_stop:
+			idle = False
+			if power_state is not None:
+				idle = idle_samplerate and not sr_edge_expected.is_set()
+				
+				if idle:
+					sigrok_device.config_set(ConfigKey.SAMPLERATE, idle_samplerate)
+					sigrok_device.config_set(ConfigKey.LIMIT_SAMPLES, 0)
+					sigrok_session.trigger = None
+					
+					sample_clock.restart(idle_samplerate)
+				else:
+					if idle_samplerate:
+						sigrok_device.config_set(ConfigKey.SAMPLERATE, samplerate)
+						sigrok_device.config_set(ConfigKey.LIMIT_SAMPLES, trigger_limit)
+					
+					# The trigger waits for the opposite level instead of an
+					# edge. If the power changed between two acquisitions, it
+					# fires immediately and the first sample differs from
+					# power_state.
+					trigger = context.create_trigger("power")
+					if power_state:
+						trigger.add_stage().add_match(power_ch, TriggerMatchType.ZERO)
+					else:
+						trigger.add_stage().add_match(power_ch, TriggerMatchType.ONE)
+					sigrok_session.trigger = trigger
+					
+					sample_clock.restart(samplerate)
+			
+			sigrok_session.start()
+			if idle:
+				# sigrok_arm() could have stopped the session just before
+				if sr_edge_expected.is_set():
+					sigrok_session.stop()
+			elif power_state is not None:
+				sr_edge_expected.clear()
+				sr_armed.set()
+			sigrok_session.run()
+			
+			sample_clock.settle()
+	
+	# called before a power command to switch from the low rate to a
+	# triggered acquisition at the full rate
+	async def sigrok_arm():
+		sr_armed.clear()
+		sr_edge_expected.set()
+		sigrok_session.stop()
+		
+		if not await eloop.run_in_executor(None, sr_armed.wait, SR_ARM_TIMEOUT):
+			bsprint("error, sigrok did not start a triggered acquisition within %s seconds" % SR_ARM_TIMEOUT, file=sys.stderr)
+	
+	if not idle_samplerate:
+		sigrok_arm = None
 
 	if args.verbose:
 		bsprint("starting sigrok thread")
@@ -806,35 +3471,104 @@ if args.sr_scan or args.sr_driver or args.sr_device or args.sr_channels:
 		sr_thread.join()
 		sys.exit(0)
 else:
+	if mrun.sigrok_channels and local_measurement:
+		bsprint("error, triggers with source=sigrok require a sigrok device", file=sys.stderr)
+		sys.exit(1)
+	if (args.sr_power_channel or args.sr_current_channel) and local_measurement:
+		bsprint("error, energy measurement requires a sigrok device", file=sys.stderr)
+		sys.exit(1)
+	
+	energy_meter = None
+	
 	sigrok_session = None
 	sr_thread = None
 	sigrok_device = None
+	sample_clock = None
+	sigrok_arm = None
 	
-	if not args.manual_power:
-		mrun.powered = True
+	# The worker of a board that shares a sigrok device receives the
+	# transitions of its power channel from the coordinator of the pool. The
+	# receiver replaces the sigrok session, hence the power state is only
+	# changed by the transitions like with a local sigrok device.
+	class PoolPowerReceiver():
+		def __init__(self, fd):
+			self.sock = socket.socket(fileno=fd)
+			self.sock.setblocking(False)
+			self.buf = b""
+			self.ready = False
+			
+			eloop.add_reader(self.sock.fileno(), self.receive)
+		
+		def receive(self):
+			global startup_counter
+			
+			data = self.sock.recv(4096)
+			if not data:
+				self.stop()
+				return
+			
+			self.buf += data
+			size = len(self.buf) - len(self.buf) % pool_power_record.size
+			for ts, state in pool_power_record.iter_unpack(self.buf[:size]):
+				if not self.ready:
+					self.ready = True
+					mrun.powered = (state == 1)
+					
+					with mainlock:
+						if args.verbose:
+							bsprint("sigrok ready")
+						
+						startup_counter |= 1
+						if startup_counter == 3:
+							asyncio.run_coroutine_threadsafe(mrun.async_start(), eloop)
+					continue
+				
+				event_bus.push_power(ts, str(state))
+				mrun.powered = (state == 1)
+			self.buf = self.buf[size:]
+		
+		def stop(self):
+			if self.sock.fileno() != -1:
+				eloop.remove_reader(self.sock.fileno())
+				self.sock.close()
 	
-	startup_counter |= 1
-	if startup_counter == 3:
-		asyncio.run_coroutine_threadsafe(mrun.async_start(), eloop)
+	if args.pool_power_fd:
+		sigrok_session = PoolPowerReceiver(int(args.pool_power_fd))
+	else:
+		if not args.manual_power:
+			mrun.powered = True
+		
+		startup_counter |= 1
+		if startup_counter == 3:
+			asyncio.run_coroutine_threadsafe(mrun.async_start(), eloop)
 
 ########
 # setup the UART interface
 
-delta_min = None
-
-# Currently, we prefer a separate thread over serial_asyncio to avoid additional
-# latency in case the main loop is busy.
-use_serial_async = False
+# By default, we prefer a separate thread over serial_asyncio or reading in the
+# event loop to avoid additional latency in case the main loop is busy.
+use_serial_async = (args.serial_reader == "serial-asyncio")
 
-if use_serial_async:
+if not local_measurement:
+	# all lines are read from the capture file or the workers of the pool
+	uart_reader = None
+elif use_serial_async:
 	import serial_asyncio
 	
 	if args.verbose:
 		bsprint("starting serial asyncio")
+	
+	# provides the serial port like the other readers, e.g., for send_sysrq_reboot()
+	class UartAsyncReader():
+		def __init__(self):
+			self.ser = None
+	
+	uart_reader = UartAsyncReader()
 
 	class Output(asyncio.Protocol):
 		def connection_made(self, transport):
 			self.transport = transport
+			uart_reader.ser = transport.serial
 			
 			if args.verbose:
 				bsprint("UART connected")
@@ -853,7 +3587,7 @@ if use_serial_async:
 		def data_received(self, data):
 			global named_pipe, delta_min
 			
-			ts = datetime.datetime.now().timestamp()
+			ts = clock_ns()
 			if self.last_ts and (delta_min is None or ts - self.last_ts < delta_min):
 				delta_min = ts - self.last_ts
 			self.last_ts = ts
@@ -887,7 +3621,7 @@ if use_serial_async:
 				newline_idx = self.buf.find(b"\n")
 				if newline_idx > -1:
 					if mrun.measuring:
-						mrun.newLine(ts, self.buf[:newline_idx], source="serial")
+						event_bus.push_line(ts, self.buf[:newline_idx], "serial")
 					self.buf = self.buf[newline_idx+1:]
 				else:
 					break
@@ -895,6 +3629,8 @@ if use_serial_async:
 		def connection_lost(self, exc):
 			global startup_counter
 			
+			uart_reader.ser = None
+			
 			if args.verbose:
 				bsprint("UART connection lost")
 			
@@ -967,6 +3703,102 @@ else:
 	# should provide more accurate timestamps.
 	single_byte = False
 	
+	uart_splitter = UartLineSplitter(event_bus.push_lines, mrun)
+	
+	def uart_missing():
+		global startup_counter
+		
+		if args.reconnect_serial:
+			with mainlock:
+				if startup_counter == 1:
+					startup_counter |= 2
+					
+					# we assume that the serial is only available when the board is powered, so
+					# we start now even if serial is not present
+					asyncio.run_coroutine_threadsafe(mrun.async_start(), eloop)
+	
+	def uart_connected():
+		global startup_counter
+		
+		if args.verbose:
+			bsprint("UART connected")
+		
+		# if we cannot monitor when the board is powered and the UART is only
+		# available when the board is powered, we use the time when the UART
+		# is available as reference.
+		if not sigrok_session and args.reconnect_serial:
+			# called by the UART thread
+			eloop.call_soon_threadsafe(mrun.setStart, clock_ns(), "uart")
+		
+		with mainlock:
+			if (startup_counter & 2) == 0:
+				startup_counter |= 2
+				if startup_counter == 3:
+					asyncio.run_coroutine_threadsafe(mrun.async_start(), eloop)
+	
+	# Reads the UART directly in the event loop without an additional thread
+	# by registering the file descriptor with add_reader(). The timestamp is
+	# taken in the callback right before reading the available bytes.
+	class UartFdReader():
+		def __init__(self):
+			self.ser = None
+			self.fd = None
+			self.stop = False
+		
+		def open(self):
+			if self.stop or global_stop:
+				return
+			
+			if not os.path.exists(args.serial_device):
+				uart_missing()
+				eloop.call_later(0.5, self.open)
+				return
+			
+			try:
+				ser = serial.Serial(args.serial_device, args.serial_baudrate, timeout=0)
+			except Exception as exc:
+				if not args.reconnect_serial:
+					bsprint("error opening %s, will try again ..." % args.serial_device, exc)
+				eloop.call_later(0.5, self.open)
+				return
+			
+			self.ser = ser
+			self.fd = ser.fileno()
+			uart_splitter.reset()
+			uart_splitter.set_port(ser)
+			
+			uart_connected()
+			
+			eloop.add_reader(self.fd, self.read)
+		
+		def read(self):
+			ts = clock_ns()
+			
+			try:
+				data = self.ser.read(self.ser.in_waiting)
+				
+				# the descriptor is readable but no data is available if the
+				# device was removed
+				if not data:
+					raise serial.SerialException("device disconnected")
+			except Exception as e:
+				if mrun.measuring:
+					bsprint("serial read failed: %s" % str(e))
+				
+				self.close()
+				eloop.call_later(0.5, self.open)
+				return
+			
+			uart_splitter.process(data, ts)
+		
+		def close(self):
+			if self.fd is not None:
+				eloop.remove_reader(self.fd)
+				self.fd = None
+			if self.ser:
+				self.ser.close()
+				self.ser = None
+	
 	def uart_tmain():
 		global delta_min, startup_counter, eloop, global_stop
 		
@@ -988,50 +3820,24 @@ else:
 					try:
 						ser = serial.Serial(args.serial_device, args.serial_baudrate, timeout=timeout)
 						uart_thread.ser = ser
-						
-						uart_thread.started.acquire()
-						uart_thread.started.notify()
-						uart_thread.started.release()
+						uart_splitter.set_port(ser)
 					except Exception as exc:
 						if not args.reconnect_serial:
 							bsprint("error opening %s, will try again ..." % args.serial_device, exc)
 						continue
 					break
 				else:
-					if args.reconnect_serial:
-						with mainlock:
-							if startup_counter == 1:
-								startup_counter |= 2
-								
-								# we assume that the serial is only available when the board is powered, so
-								# we start now even if serial is not present
-								asyncio.run_coroutine_threadsafe(mrun.async_start(), eloop)
+					uart_missing()
 			
 			if uart_thread.stop or global_stop:
 				break
 			
-			if args.verbose:
-				bsprint("UART connected")
-			
-			# if we cannot monitor when the board is powered and the UART is only
-			# available when the board is powered, we use the time when the UART
-			# is available as reference.
-			if not sigrok_session and args.reconnect_serial:
-				ts = datetime.datetime.now().timestamp()
-				
-				mrun.start_ts = ts
-				mrun.last_ts = ts
-			
-			with mainlock:
-				if (startup_counter & 2) == 0:
-					startup_counter |= 2
-					if startup_counter == 3:
-						asyncio.run_coroutine_threadsafe(mrun.async_start(), eloop)
+			uart_connected()
 			
 			last_ts = None
 			ts = None
-			last_buf_ts = None
 			buf = b""
+			uart_splitter.reset()
 			while not uart_thread.stop and not global_stop:
 				if single_byte:
 					try:
@@ -1042,7 +3848,7 @@ else:
 						break
 					
 					if ts is None:
-						ts = datetime.datetime.now().timestamp()
+						ts = clock_ns()
 						
 						if True:
 							data_available = [ser.in_waiting]
@@ -1055,7 +3861,7 @@ else:
 					
 					if d == b"\n":
 						if mrun.measuring:
-							eloop.call_soon_threadsafe(functools.partial(mrun.newLine, ts, buf, source="serial"))
+							event_bus.push_line(ts, buf, "serial")
 						
 						if last_ts and (delta_min is None or ts - last_ts < delta_min):
 							delta_min = ts - last_ts
@@ -1091,88 +3897,67 @@ else:
 						#print("diff", len(data), data_available[0])
 					
 					#if ts is None:
-					ts = datetime.datetime.now().timestamp()
-					
-					if last_ts and (delta_min is None or ts - last_ts < delta_min):
-						delta_min = ts - last_ts
-					last_ts = ts
-					
-					if args.verbose > 1:
-						bsprint("UART RX %d bytes" % len(data), ts=ts)
+					ts = clock_ns()
 					
-					lines = []
-					last_newline = 0
-					for i in range(len(data)):
-						if data[i] == ord("\n"):
-							line = buf + data[last_newline:i]
-							line = bytes(filter(lambda x: x >= 32, line))
-							
-							if mrun.measuring:
-								if buf:
-									lines.append([last_buf_ts, line])
-									last_buf_ts = None
-								else:
-									lines.append([ts, line])
-							
-							buf = b""
-							last_newline = i+1
-					
-					if lines:
-						eloop.call_soon_threadsafe(functools.partial(mrun.newLines, lines, source="serial"))
-					
-					if mrun.flush_input:
-						continue
-					
-					if last_newline < len(data):
-						buf += data[last_newline:]
-						if last_buf_ts is None:
-							last_buf_ts = ts
+					uart_splitter.process(data, ts)
 		
 		if args.verbose:
 			bsprint("serial thread stopped")
 	
-	uart_thread = threading.Thread(target=uart_tmain)
-	uart_thread.started = threading.Condition()
-	uart_thread.stop = False
-	uart_thread.ser = None
-	uart_thread.start()
-	
-	def my_break(ser, secs):
-		from time import sleep
-		
-		# serial.send_break() only calls termios.tcsendbreak on posix (!) systems
-		# which more or less ignores the duration parameter
+	if args.serial_reader == "fd":
+		uart_reader = UartFdReader()
+		eloop.call_soon(uart_reader.open)
+	else:
+		uart_thread = threading.Thread(target=uart_tmain)
+		uart_thread.stop = False
+		uart_thread.ser = None
+		uart_thread.start()
 		
-		ser.break_condition = True
-		sleep(secs)
+		uart_reader = uart_thread
+
+async def my_break(ser, secs):
+	# serial.send_break() only calls termios.tcsendbreak on posix (!) systems
+	# which more or less ignores the duration parameter
+	
+	ser.break_condition = True
+	try:
+		await asyncio.sleep(secs)
+	finally:
 		ser.break_condition = False
+
+# runs in the event loop, which continues to read the UART in the meantime
+async def send_sysrq_reboot():
+	# TODO we issue a cache sync command but we do not know when it really
+	# finishes - but it should be better than just pulling the plug.
+	secs = int(os.environ.get("BOOTSTATS_WAIT", "1"))
 	
-	def send_sysrq_reboot():
-		# TODO we issue a cache sync command but we do not know when it really
-		# finishes - but it should be better than just pulling the plug.
-		secs = int(os.environ.get("BOOTSTATS_WAIT", "1"))
-		
-		bsprint("will reboot using sysrq in", secs * 3, "secs")
-		
-		my_break(uart_thread.ser, secs)
-		uart_thread.ser.write(b"u")
-		uart_thread.ser.flush()
-		my_break(uart_thread.ser, secs)
-		uart_thread.ser.write(b"s")
-		uart_thread.ser.flush()
-		my_break(uart_thread.ser, secs)
-		uart_thread.ser.write(b"b")
-		uart_thread.ser.flush()
-		
-		mrun.flush_input = True
+	bsprint("will reboot using sysrq in", secs * 3, "secs")
+	
+	await my_break(uart_reader.ser, secs)
+	uart_reader.ser.write(b"u")
+	uart_reader.ser.flush()
+	await my_break(uart_reader.ser, secs)
+	uart_reader.ser.write(b"s")
+	uart_reader.ser.flush()
+	await my_break(uart_reader.ser, secs)
+	uart_reader.ser.write(b"b")
+	uart_reader.ser.flush()
+	
+	mrun.flush_input = True
+
+if power_backend:
+	if args.verbose:
+		bsprint("opening power backend", power_backend["name"])
+	
+	eloop.run_until_complete(power_backend["module"].open(power_backend))
 
-if args.poweroff and not args.manual_power:
+if (args.poweroff or power_backend) and not args.manual_power and local_measurement:
 	if args.verbose:
 		bsprint("initial cooldown", args.cooldown, "seconds")
 	
 	# make sure the device is off at the beginning
 	mrun.powered=True
-	mrun.power_off(initial=True)
+	eloop.run_until_complete(mrun.power_off(initial=True))
 	
 	time.sleep(args.cooldown)
 
@@ -1190,7 +3975,7 @@ if False:
 	
 	eloop.set_exception_handler(custom_exception_handler)
 
-if True:
+if local_measurement:
 	from systemd import journal
 	
 	j = journal.Reader()
@@ -1200,22 +3985,317 @@ if True:
 	j.seek_tail()
 	j.get_previous()
 	
-	async def process_journal(event):
-		if not mrun.measuring:
-			return
-		
-		ts = datetime.datetime.now().timestamp()
-		
-		mrun.newLine(ts, event["MESSAGE"].encode(), source="journald")
-	
 	def journal_event():
 		j.process()
+		
+		ts = clock_ns()
 		for entry in j:
-			asyncio.ensure_future(process_journal(entry))
+			if not mrun.measuring:
+				continue
+			
+			event_bus.push_line(ts, entry["MESSAGE"].encode(), "journald")
 	
 	eloop.add_reader(j.fileno(), journal_event)
 
-eloop.run_forever()
+# Feed all records of a capture file through the same matching and statistics
+# code as fast as possible. The recorded iterations replace the power cycles.
+def replay_capture(path):
+	global iterations, clock_offset_ns
+	
+	reader = CaptureReader(path)
+	
+	# show the time of day of the recording
+	clock_offset_ns = reader.clock_offset_ns
+	
+	# the capture counts the iterations from 0
+	first = last = None
+	if args.replay_iterations:
+		arr = args.replay_iterations.split("-")
+		try:
+			first = int(arr[0]) - 1
+			last = int(arr[-1]) - 1
+		except ValueError:
+			first = -1
+		if len(arr) > 2 or first < 0 or last < first:
+			bsprint("error, invalid --replay-iterations %s, expected N or N-M with 1 <= N <= M" % args.replay_iterations, file=sys.stderr)
+			sys.exit(1)
+	
+	replayed = 0
+	# iterations without a power-on or restart record, e.g., in captures of
+	# sysrq reboots of older versions
+	not_started = 0
+	for ts, kind, source, payload in reader.records(first, last):
+		if kind == "iteration":
+			if replayed:
+				iterations += 1
+				if mrun.start_ts is None:
+					not_started += 1
+			replayed += 1
+			
+			mrun.replayIteration(int(payload))
+		elif kind == "power":
+			mrun.replayPower(ts, payload.decode(), source)
+		elif kind == "line":
+			mrun.newLine(ts, payload, source=source)
+	
+	if replayed:
+		iterations += 1
+		if mrun.start_ts is None:
+			not_started += 1
+	
+	if not_started:
+		bsprint("warning, %d of %d iterations in %s have no power-on or restart record and were not measured" % (not_started, replayed, path), file=sys.stderr)
+
+# Start one worker process per board and hand out the iterations one by one
+# until the requested number is reached. Hence, faster boards measure more
+# iterations. Afterwards, the histories of all workers are merged.
+def run_board_pool(boards):
+	global iterations
+	
+	import subprocess, tempfile, json, shutil
+	
+	total = int(args.iterations)
+	remaining = total
+	tmpdir = tempfile.mkdtemp(prefix="bootstats-")
+	workers = []
+	
+	def handle_request(worker):
+		nonlocal remaining
+		
+		data = worker["sock"].recv(64)
+		if not data:
+			eloop.remove_reader(worker["sock"].fileno())
+			return
+		
+		for i in range(len(data)):
+			if remaining > 0:
+				remaining -= 1
+				worker["sock"].sendall(b"1")
+			else:
+				worker["sock"].sendall(b"0")
+	
+	def check_workers():
+		if all(worker["proc"].poll() is not None for worker in workers):
+			eloop.stop()
+		else:
+			eloop.call_later(0.2, check_workers)
+	
+	for board in boards:
+		if remaining == 0:
+			break
+		
+		# every worker starts with one iteration
+		remaining -= 1
+		
+		parent_sock, child_sock = socket.socketpair()
+		results_path = os.path.join(tmpdir, board + ".json")
+		cmd = [sys.executable, sys.argv[0]] + sys.argv[1:] + [
+			"--config", args.config,
+			"--iterations", str(total),
+			"--board", board,
+			"--pool-fd", str(child_sock.fileno()),
+			"--pool-results", results_path,
+			]
+		pass_fds = [child_sock.fileno()]
+		
+		# the power transitions of boards sharing a sigrok device
+		if board in pool_power_socks:
+			power_sock = pool_power_socks[board][1]
+			cmd += ["--pool-power-fd", str(power_sock.fileno())]
+			pass_fds.append(power_sock.fileno())
+		
+		if args.verbose:
+			bsprint("starting worker for board", board)
+		
+		proc = subprocess.Popen(cmd, pass_fds=pass_fds)
+		child_sock.close()
+		if board in pool_power_socks:
+			power_sock.close()
+		
+		worker = { "board": board, "proc": proc, "sock": parent_sock, "results": results_path }
+		workers.append(worker)
+		
+		eloop.add_reader(parent_sock.fileno(), functools.partial(handle_request, worker))
+	
+	check_workers()
+	eloop.run_forever()
+	
+	for worker in workers:
+		worker["proc"].wait()
+		worker["sock"].close()
+		
+		if not os.path.isfile(worker["results"]):
+			bsprint("error, no results from board", worker["board"], file=sys.stderr)
+			continue
+		
+		with open(worker["results"]) as f:
+			data = json.load(f)
+		
+		board_stats[worker["board"]] = {}
+		iterations += data["iterations"]
+		
+		for mpoint, state in data["stats"].items():
+			board_stats[worker["board"]][mpoint] = RunningStats(*state)
+			
+			if mpoint not in mrun.stats:
+				mrun.stats[mpoint] = RunningStats()
+			mrun.stats[mpoint].merge(RunningStats(*state))
+		
+		for mpoint, state in data["sketches"].items():
+			if mpoint not in mrun.sketches:
+				mrun.sketches[mpoint] = QuantileSketch()
+			mrun.sketches[mpoint].merge(QuantileSketch(state))
+		
+		for mpoint, state in data["share_stats"].items():
+			if mpoint not in mrun.share_stats:
+				mrun.share_stats[mpoint] = RunningStats()
+			mrun.share_stats[mpoint].merge(RunningStats(*state))
+		
+		# names of additional values of triggers with multi_trigger
+		for mpoint, name in data["names"].items():
+			if mpoint not in mrun.mpoints and mpoint not in mrun.mintervals:
+				mrun.mpoints[mpoint] = { "name": name }
+		
+		for name, values in data["power_latency"].items():
+			if name not in mrun.power_latency:
+				mrun.power_latency[name] = []
+			mrun.power_latency[name].extend(values)
+		
+		for name, (energy, duration) in data["energy_stats"].items():
+			if name not in mrun.energy_stats:
+				mrun.energy_stats[name] = (RunningStats(), RunningStats())
+			mrun.energy_stats[name][0].merge(RunningStats(*energy))
+			mrun.energy_stats[name][1].merge(RunningStats(*duration))
+	
+	shutil.rmtree(tmpdir)
+
+# Wait for agents and merge their values as they arrive. The values of every
+# agent are also kept separately to show them per agent.
+def run_collector(address):
+	family, addr = agent_address(address)
+	connections = set()
+	
+	# database run and current iteration of every agent
+	agent_runs = {}
+	# offset of the clock of every agent to the wall clock
+	agent_offsets = {}
+	
+	def collect(name, mpoint, value, ts):
+		if result_store:
+			run, iteration = agent_runs[name]
+			result_store.add(run, iteration, mpoint, value, (ts + agent_offsets[name]) / NS_PER_SEC)
+		
+		if mpoint not in mrun.stats:
+			mrun.stats[mpoint] = RunningStats()
+		mrun.stats[mpoint].add(value)
+		if mpoint not in mrun.sketches:
+			mrun.sketches[mpoint] = QuantileSketch()
+		mrun.sketches[mpoint].add(value)
+		
+		if mpoint not in board_stats[name]:
+			board_stats[name][mpoint] = RunningStats()
+		board_stats[name][mpoint].add(value)
+		
+		if mpoint in mrun.mpoints:
+			pretty_name = mrun.mpoints[mpoint].get("name", mpoint)
+		elif mpoint in mrun.mintervals:
+			pretty_name = mrun.mintervals[mpoint].get("name", mpoint)
+		else:
+			# e.g., additional values of triggers with multi_trigger
+			mrun.mpoints[mpoint] = { "name": mpoint }
+			pretty_name = mpoint
+		
+		print("[%s] %*s %10.6f" % (name, mrun.max_name_length, pretty_name, value))
+	
+	async def handle_agent(reader, writer):
+		global iterations
+		
+		connections.add(asyncio.current_task())
+		name = None
+		try:
+			while True:
+				length, = agent_frame_header.unpack(await reader.readexactly(agent_frame_header.size))
+				data = await reader.readexactly(length)
+				
+				pos = 0
+				while pos < length:
+					ts, kind, plen = agent_record_header.unpack_from(data, pos)
+					pos += agent_record_header.size
+					payload = data[pos:pos+plen]
+					pos += plen
+					
+					if kind == AGENT_HELLO:
+						name, agent_hash, revision, tag, offset = (payload.decode().split("\0") + ["", "", "", "0"])[:5]
+						
+						# several agents could use the same name
+						if name in board_stats:
+							i = 2
+							while "%s#%d" % (name, i) in board_stats:
+								i += 1
+							name = "%s#%d" % (name, i)
+						board_stats[name] = {}
+						agent_offsets[name] = int(offset)
+						if result_store:
+							# the first iteration event starts iteration 0
+							agent_runs[name] = [result_store.startRun(name, agent_hash or None, revision or None, tag or None), -1]
+						
+						bsprint("agent", name, "connected")
+					elif name is None:
+						bsprint("error, agent did not send its name", file=sys.stderr)
+						break
+					elif kind == AGENT_ITERATION:
+						iterations += 1
+						if name in agent_runs:
+							agent_runs[name][1] += 1
+					elif kind == AGENT_POWER:
+						if args.verbose:
+							bsprint("[%s] power is %s" % (name, "on" if payload == b"1" else "off"))
+					elif kind == AGENT_VALUE:
+						value, = agent_value.unpack_from(payload)
+						collect(name, payload[agent_value.size:].decode(), value, ts)
+					elif kind == AGENT_LINE:
+						if args.show_console:
+							source, sep, line = payload.partition(b"\x00")
+							print("[%s] %s" % (name, line.decode(errors="replace").rstrip()))
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+		except asyncio.CancelledError:
+			return
+		finally:
+			writer.close()
+			connections.discard(asyncio.current_task())
+			if name in agent_runs:
+				result_store.finishRun(agent_runs[name][0])
+		
+		bsprint("agent", name, "disconnected")
+	
+	if family == socket.AF_UNIX:
+		server = eloop.run_until_complete(asyncio.start_unix_server(handle_agent, path=addr))
+	else:
+		server = eloop.run_until_complete(asyncio.start_server(handle_agent, addr[0] or None, addr[1]))
+	
+	bsprint("waiting for agents on", address)
+	
+	eloop.run_forever()
+	
+	server.close()
+	for task in list(connections):
+		task.cancel()
+	eloop.run_until_complete(asyncio.gather(*connections, return_exceptions=True))
+	
+	if family == socket.AF_UNIX and os.path.exists(addr):
+		os.unlink(addr)
+
+board_stats = {}
+
+if args.replay:
+	replay_capture(args.replay)
+elif pool_boards:
+	run_board_pool(pool_boards)
+elif args.collector:
+	run_collector(args.collector)
+else:
+	eloop.run_forever()
 
 global_stop = True
 
@@ -1229,34 +4309,98 @@ eloop.run_until_complete(eloop.shutdown_asyncgens())
 
 if mrun.delayed_poweroff_task:
 	mrun.delayed_poweroff_task.cancel()
+# do not leave the device in an unknown state
+if mrun.power_task and not mrun.power_task.done():
+	eloop.run_until_complete(mrun.power_task)
+
+# The samples for the energy of the last mpoints and of the final power-off
+# arrive after the loop was stopped. Keep processing events until sigrok
+# delivered them as results that arrive after the loop is closed are lost.
+async def drain_energy():
+	deadline = clock_ns() + ENERGY_DRAIN_NS
+	while (mrun.powered or event_bus.depth() or energy_meter.pending) and clock_ns() < deadline:
+		await asyncio.sleep(0.01)
+	
+	energy_meter.flush()
+	# run the callbacks of the resolved lookups
+	await asyncio.sleep(0)
+
+if energy_meter:
+	eloop.run_until_complete(drain_energy())
 if mrun.start_task:
 	mrun.start_task.cancel()
-if use_serial_async:
+if not local_measurement:
+	pass
+elif use_serial_async:
 	if wait_task:
 		wait_task.cancel()
+elif args.serial_reader == "fd":
+	uart_reader.close()
 else:
-	if uart_thread.ser:
-		uart_thread.ser.close()
-	uart_thread.join()
+	if uart_reader.ser:
+		uart_reader.ser.close()
+	uart_reader.join()
+
+if power_backend:
+	eloop.run_until_complete(power_backend["module"].close(power_backend))
 
 eloop.close()
-if sigrok_session:
-	sigrok_session.stop()
 if sr_thread:
-	sr_thread.join()
+	# with --sr-trigger, a new acquisition could start in the meantime
+	while sr_thread.is_alive():
+		if sigrok_session:
+			sigrok_session.stop()
+		sr_thread.join(0.1)
+elif sigrok_session:
+	sigrok_session.stop()
 if sigrok_device:
 	sigrok_device.close()
 
-if args.pipe:
+if named_pipe:
 	named_pipe.close()
 	os.unlink(args.pipe)
 
-global_ts_end = datetime.datetime.now().timestamp()
+if capture_writer:
+	capture_writer.close()
+
+if agent:
+	agent.close()
+
+if result_store:
+	if store_run:
+		result_store.finishRun(store_run)
+	result_store.close()
+
+global_ts_end = clock_ns()
 
 if args.verbose:
-	bsprint("measurements done after %d seconds" % (global_ts_end - global_ts_start))
+	bsprint("measurements done after %d seconds" % ((global_ts_end - global_ts_start) / NS_PER_SEC))
 	if delta_min is not None:
-		bsprint("min time between serial RX: %.6f" % delta_min)
+		bsprint("min time between serial RX: %.6f" % (delta_min / NS_PER_SEC))
+	if ts_correction_lines:
+		bsprint("line timestamp correction: avg %.6f max %.6f (%d lines)" % (ts_correction_sum / ts_correction_lines / NS_PER_SEC, ts_correction_max / NS_PER_SEC, ts_correction_lines))
+	bsprint("event queue: %d events in %d batches, max depth %d, dropped %d" % (event_bus.pushed, event_bus.batches, event_bus.max_depth, event_bus.dropped))
+	if sample_clock:
+		bsprint("sigrok sample clock: %d samples, %d resyncs, max correction %.6f" % (sample_clock.samples, sample_clock.resyncs, sample_clock.max_correction / NS_PER_SEC))
+		if sample_clock.acquisitions:
+			bsprint("sigrok acquisitions: %d, average delay of the first packet %.6f" % (sample_clock.acquisitions, sample_clock.first_delay / NS_PER_SEC))
+
+# a worker of a board pool only passes its values to the coordinator
+if args.pool_results:
+	import json
+	
+	with open(args.pool_results, "w") as f:
+		# the counter is not incremented after the last iteration
+		json.dump({
+			"iterations": iterations + 1,
+			"stats": { mpoint: stats.state() for mpoint, stats in mrun.stats.items() },
+			"share_stats": { mpoint: stats.state() for mpoint, stats in mrun.share_stats.items() },
+			"sketches": { mpoint: sketch.state() for mpoint, sketch in mrun.sketches.items() },
+			"names": { mpoint: mrun.mpoints[mpoint]["name"] for mpoint in mrun.stats if mpoint in mrun.mpoints },
+			"power_latency": mrun.power_latency,
+			"energy_stats": { name: (energy.state(), duration.state()) for name, (energy, duration) in mrun.energy_stats.items() },
+			}, f)
+	sys.exit(0)
 
 conv = {
 	"avg": "%10.6f",
@@ -1268,46 +4412,33 @@ conv = {
 	"max_val": "%10.6f",
 	"weight": "%6d",
 	}
+
+# average energy (J) and power (W) of every stage
+if mrun.energy_stats:
+	conv["energy"] = "%10.6f"
+	conv["power"] = "%10.6f"
+
 stat_names = conv.keys()
 
 results = {}
 print(f"Results after {iterations} runs:")
 
-mrun.history["power_on"] = [0] * iterations
+mrun.stats["power_on"] = RunningStats(iterations, 0.0, 0.0, 0.0, 0.0)
 
-for mpoint in mrun.history:
-	avg = None
-	weight = 0
-	for ts in mrun.history[mpoint]:
-		if avg is None:
-			avg = ts
-			weight = 1
-			continue
-		
-		avg += ts
-		weight += 1
+for mpoint in mrun.stats:
+	weight = mrun.stats[mpoint].n
 	
 	if weight == 0:
-		print("no values for", mpoint, mrun.history[mpoint])
+		print("no values for", mpoint)
 		continue
 	
-	avg = avg / weight
+	avg = mrun.stats[mpoint].mean
 	
 	if weight > 1:
-		dev = 0
-		max_dev = None
-		min_val = None
-		max_val = None
-		for ts in mrun.history[mpoint]:
-			dev += (avg - ts) ** 2
-			if max_dev is None or abs(avg - ts) > max_dev:
-				max_dev = abs(avg - ts)
-			if min_val is None or ts < min_val:
-				min_val = ts
-			if max_val is None or ts > max_val:
-				max_val = ts
-		
-		dev = (dev / (weight - 1)) ** 0.5
+		dev = mrun.stats[mpoint].dev()
+		min_val = mrun.stats[mpoint].min
+		max_val = mrun.stats[mpoint].max
+		max_dev = max(avg - min_val, max_val - avg)
 	else:
 		dev = 0
 		max_dev = 0
@@ -1321,12 +4452,15 @@ for mpoint in mrun.history:
 		results[mpoint] = {"name": mrun.mintervals[mpoint]["name"], "dur": avg, "avg": None}
 		
 		share = 0
-		if "power_off" in mrun.history and len(mrun.history[mpoint]) == len(mrun.history["power_off"]):
-			for i in range(len(mrun.history[mpoint])):
-				ts = mrun.history[mpoint][i]
-				share += ts / mrun.history["power_off"][i]
-			
-			share = share / len(mrun.history[mpoint]) * 100
+		if mpoint in mrun.share_stats:
+			share = mrun.share_stats[mpoint].mean
+	
+	energy = None
+	power = None
+	if mpoint in mrun.energy_stats:
+		energy = mrun.energy_stats[mpoint][0].mean
+		if mrun.energy_stats[mpoint][1].mean > 0:
+			power = energy / mrun.energy_stats[mpoint][1].mean
 	
 	for var in stat_names:
 		if var in locals() and var not in results[mpoint]:
@@ -1362,6 +4496,146 @@ for mpoint in results:
 			print(lconv % "", end=" ")
 	print()
 
+if board_stats:
+	if args.collector:
+		print("\nAverage per agent:")
+	else:
+		print("\nAverage per board:")
+	
+	print("%-*s" % (mrun.max_name_length, "Id"), end=" ")
+	for board in board_stats:
+		print("%10s %4s" % (board[:10], "n"), end=" ")
+	print()
+	
+	for mpoint in results:
+		if mpoint in ["power_on"]:
+			continue
+		
+		if mpoint in mrun.mpoints:
+			pretty_name = mrun.mpoints[mpoint].get("name", "")
+		else:
+			pretty_name = mrun.mintervals[mpoint].get("name", "")
+		
+		print("%-*s" % (mrun.max_name_length, pretty_name), end=" ")
+		for board, stats in board_stats.items():
+			if mpoint in stats and stats[mpoint].n:
+				print("%10.6f %4d" % (stats[mpoint].mean, stats[mpoint].n), end=" ")
+			else:
+				print("%10s %4s" % ("", ""), end=" ")
+		print()
+
+if mrun.sketches:
+	print("\nPercentiles:")
+	print("%-*s %6s %10s %10s %10s %10s" % (mrun.max_name_length, "Id", "n", "p50", "p90", "p99", "p99.9"))
+	for mpoint in results:
+		if mpoint in ["power_on"] or mpoint not in mrun.sketches:
+			continue
+		
+		if mpoint in mrun.mpoints:
+			pretty_name = mrun.mpoints[mpoint].get("name", "")
+		else:
+			pretty_name = mrun.mintervals[mpoint].get("name", "")
+		
+		sketch = mrun.sketches[mpoint]
+		print("%-*s %6d %10.6f %10.6f %10.6f %10.6f" % (
+			mrun.max_name_length, pretty_name, sketch.n,
+			sketch.quantile(0.5),
+			sketch.quantile(0.9),
+			sketch.quantile(0.99),
+			sketch.quantile(0.999),
+			))
+	
+	if args.histogram:
+		for mpoint in results:
+			if mpoint in ["power_on"] or mpoint not in mrun.sketches:
+				continue
+			
+			if mpoint in mrun.mpoints:
+				pretty_name = mrun.mpoints[mpoint].get("name", "")
+			else:
+				pretty_name = mrun.mintervals[mpoint].get("name", "")
+			
+			print("\nHistogram of %s:" % pretty_name)
+			for line in mrun.sketches[mpoint].histogram(int(args.histogram_rows)):
+				print(line)
+
+if mrun.power_latency:
+	print("\nPower command latency:")
+	print("%-*s %6s %10s %10s %10s %10s" % (mrun.max_name_length, "Command", "n", "avg", "p50", "p90", "max"))
+	for name, values in mrun.power_latency.items():
+		values = sorted(values)
+		print("%-*s %6d %10.6f %10.6f %10.6f %10.6f" % (
+			mrun.max_name_length, name, len(values),
+			sum(values) / len(values),
+			values[len(values) // 2],
+			values[min(len(values) - 1, int(len(values) * 0.9))],
+			values[-1],
+			))
+
+# convert a threshold in seconds or in percent of the reference value
+def gate_seconds(value, reference):
+	if value.endswith("%"):
+		return abs(reference) * float(value[:-1]) / 100
+	return float(value)
+
+# compare the values of every Id with the reference using Welch's t-test and
+# return the Ids that are significantly slower by more than the threshold
+def check_regressions(results, ref):
+	alpha = float(args.gate_alpha)
+	regressions = []
+	
+	print("\nRegression check (alpha %g):" % alpha)
+	print("%-*s %10s %10s %10s %8s %10s %s" % (mrun.max_name_length, "Id", "ref", "current", "diff", "p", "threshold", "result"))
+	for mpoint in results:
+		if mpoint in ["power_on", "power_off"] or mpoint not in ref:
+			continue
+		
+		if mpoint in mrun.mpoints:
+			pretty_name = mrun.mpoints[mpoint].get("name", "")
+			cfg = mrun.mpoints[mpoint].get("config", {})
+			key = "avg"
+		else:
+			pretty_name = mrun.mintervals[mpoint].get("name", "")
+			cfg = mrun.mintervals[mpoint].get("config", {})
+			key = "dur"
+		
+		if results[mpoint].get(key) is None or ref[mpoint].get(key) is None:
+			continue
+		
+		current = results[mpoint][key]
+		reference = ref[mpoint][key]
+		
+		threshold = gate_seconds(cfg.get("max_regression", args.gate_threshold), reference)
+		
+		dev = results[mpoint]["dev"] or 0
+		ref_dev = ref[mpoint].get("dev") or 0
+		test = welch_test(
+			current, dev, results[mpoint]["weight"],
+			reference, ref_dev, ref[mpoint].get("weight") or 0,
+			)
+		
+		# without any variation, the t-test considers every difference as
+		# significant, e.g., a rounding error of the timestamps
+		if dev == 0 and ref_dev == 0:
+			threshold = max(threshold, gate_seconds(args.gate_min_effect, reference))
+		
+		if test is None:
+			result = "too few values"
+			p = ""
+		else:
+			t, df, p = test
+			if p < alpha and current - reference > threshold:
+				result = "REGRESSION"
+				regressions.append(mpoint)
+			else:
+				result = "ok"
+			p = "%8.4f" % p
+		
+		print("%-*s %10.6f %10.6f %10.6f %8s %10.6f %s" % (mrun.max_name_length, pretty_name, reference, current, current - reference, p, threshold, result))
+	
+	return regressions
+
+regressions = []
 if args.ref_file:
 	if not os.path.isfile(args.ref_file):
 		import pprint
@@ -1397,7 +4671,7 @@ if args.ref_file:
 			
 			diff={ "mpoint": mpoint }
 			for stat in stat_names:
-				if results[mpoint][stat] is not None and ref[mpoint][stat] is not None:
+				if results[mpoint][stat] is not None and ref[mpoint].get(stat) is not None:
 					diff[stat] = results[mpoint][stat] - ref[mpoint][stat]
 			
 			print("%-*s" % (mrun.max_name_length, pretty_name), end=" ")
@@ -1409,6 +4683,9 @@ if args.ref_file:
 					print(lconv % "", end=" ")
 			print()
 		
+		if args.gate:
+			regressions = check_regressions(results, ref)
+		
 		if args.show_reference:
 			print("\nReference values:", args.ref_file)
 			for mpoint in ref:
@@ -1422,9 +4699,13 @@ if args.ref_file:
 				
 				print("%-*s" % (mrun.max_name_length, pretty_name), end=" ")
 				for key in stat_names:
-					if ref[mpoint][key]:
+					if ref[mpoint].get(key):
 						print(conv[key] % ref[mpoint][key], end=" ")
 					else:
 						lconv = conv[key].replace(".6", "")[:-1]+"s"
 						print(lconv % "", end=" ")
 				print()
+
+if regressions:
+	bsprint("error, regression of", ", ".join(regressions), file=sys.stderr)
+	sys.exit(1)
@@ -0,0 +1,112 @@
+#
+# power backend that starts a helper program once and keeps it running during
+# the whole measurement. bootstats sends "on" or "off" as a line to its stdin
+# and the helper confirms the switch by writing a line to its stdout. If the
+# helper exits or does not reply in time, it is killed and started again with
+# the next switch.
+#
+# [power_coprocess]
+# command=relay_helper.py /dev/ttyACM0
+#
+
+import asyncio, os, signal, sys
+
+backend_name = None
+bglobals = None
+proc = None
+# set if the helper has to be replaced before the next request
+broken = False
+
+async def start_helper(backend_dict):
+	global proc, broken
+	
+	if bglobals["args"].verbose:
+		bglobals["bsprint"](backend_name, "starting", backend_dict["command"])
+	
+	proc = await asyncio.create_subprocess_shell(
+		backend_dict["command"],
+		stdin=asyncio.subprocess.PIPE,
+		stdout=asyncio.subprocess.PIPE,
+		start_new_session=True,
+		)
+	broken = False
+
+async def stop_helper():
+	global proc
+	
+	# the helper runs in its own process group as children of the shell
+	# would otherwise keep its stdout open
+	try:
+		os.killpg(proc.pid, signal.SIGKILL)
+	except ProcessLookupError:
+		pass
+	await proc.wait()
+	proc = None
+
+# called by bootstats before the device is powered off initially
+async def open(backend_dict):
+	if "command" not in backend_dict:
+		bglobals["bsprint"]("error, no command for power backend", backend_name, file=sys.stderr)
+		sys.exit(1)
+	
+	await start_helper(backend_dict)
+
+async def switch(backend_dict, state):
+	global broken
+	
+	if broken or proc.returncode is not None:
+		bglobals["bsprint"]("error, restarting helper of power backend", backend_name, file=sys.stderr)
+		await stop_helper()
+		await start_helper(backend_dict)
+	
+	start_ts = bglobals["clock_ns"]()
+	
+	try:
+		proc.stdin.write(state.encode() + b"\n")
+		await proc.stdin.drain()
+		
+		reply = await proc.stdout.readline()
+	except (BrokenPipeError, ConnectionResetError):
+		reply = b""
+	except asyncio.CancelledError:
+		# bootstats stopped waiting for the reply. The helper would still
+		# send it later and we would take it as the reply to the next
+		# request, hence we replace the helper before the next request.
+		broken = True
+		raise
+	end_ts = bglobals["clock_ns"]()
+	
+	if not reply:
+		bglobals["bsprint"]("error, helper of power backend %s exited unexpectedly while switching %s" % (backend_name, state), file=sys.stderr)
+		broken = True
+	elif bglobals["args"].verbose > 1:
+		bglobals["bsprint"](backend_name, "reply", reply.strip())
+	
+	return start_ts, end_ts
+
+# called by bootstats to power on the device, returns the timestamps when the
+# switch was requested and when it was confirmed
+async def on(backend_dict):
+	return await switch(backend_dict, "on")
+
+async def off(backend_dict):
+	return await switch(backend_dict, "off")
+
+async def close(backend_dict):
+	if not proc:
+		return
+	
+	if not broken:
+		proc.stdin.close()
+		try:
+			await asyncio.wait_for(proc.wait(), 1)
+		except asyncio.TimeoutError:
+			pass
+	await stop_helper()
+
+# called by bootstats at startup to initialize the backend
+def init(bootstats_globals, name):
+	global backend_name, bglobals
+	
+	backend_name = name
+	bglobals = bootstats_globals
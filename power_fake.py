@@ -0,0 +1,59 @@
+#
+# fake power backend for tests that only waits a configurable time to simulate
+# a relay. Optionally, "on" and "off" are written to a file or named pipe that
+# is kept open during the whole measurement, e.g., to control a simulated
+# device.
+#
+
+import asyncio, random
+
+backend_name = None
+bglobals = None
+output = None
+
+# called by bootstats before the device is powered off initially
+async def open(backend_dict):
+	global output
+	
+	if "output" in backend_dict:
+		import builtins
+		
+		if bglobals["args"].verbose:
+			bglobals["bsprint"](backend_name, "opening", backend_dict["output"])
+		
+		output = builtins.open(backend_dict["output"], "w")
+
+async def switch(backend_dict, state):
+	start_ts = bglobals["clock_ns"]()
+	
+	if output:
+		output.write(state + "\n")
+		output.flush()
+	
+	delay = float(backend_dict.get("delay", 0.01))
+	delay += random.uniform(0, float(backend_dict.get("jitter", 0)))
+	await asyncio.sleep(delay)
+	
+	return start_ts, bglobals["clock_ns"]()
+
+# called by bootstats to power on the device, returns the timestamps when the
+# switch was requested and when it was confirmed
+async def on(backend_dict):
+	return await switch(backend_dict, "on")
+
+async def off(backend_dict):
+	return await switch(backend_dict, "off")
+
+async def close(backend_dict):
+	global output
+	
+	if output:
+		output.close()
+		output = None
+
+# called by bootstats at startup to initialize the backend
+def init(bootstats_globals, name):
+	global backend_name, bglobals
+	
+	backend_name = name
+	bglobals = bootstats_globals
@@ -2,7 +2,7 @@
 # example task that sends UDP packets to the device and logs the reponse
 #
 
-import asyncio, socket, datetime, functools
+import asyncio, socket, functools
 
 task_name = None
 bglobals = None
@@ -39,12 +39,12 @@ class UDPHandler(asyncio.DatagramProtocol):
 	
 	def datagram_received(self, data, addr):
 		# send the response to the bootstats core
-		ts = datetime.datetime.now().timestamp()
+		ts = bglobals["clock_ns"]()
 		
 		if bglobals["args"].verbose:
 			bglobals["bsprint"](task_name, "rx", data)
 		
-		bglobals["mrun"].newLine(ts, data, source="task_"+task_name)
+		bglobals["event_bus"].push_task(ts, data, "task_"+task_name)
 	
 	def error_received(self, exc):
 		bglobals["bsprint"](task_name, "error", exc)